@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import datetime
+import hashlib
+import importlib.util
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,17 +43,22 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'hospital',
 ]
 
 MIDDLEWARE = [
+    'hospital.metrics.MetricsMiddleware',
+    'hospital.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hospital.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hospital.audit.AuditFlushMiddleware',
 ]
 
 ROOT_URLCONF = 'guardiandb.urls'
@@ -75,6 +86,14 @@ WSGI_APPLICATION = 'guardiandb.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connection reuse, configured from the environment. DB_POOL=1 uses Django's
+# psycopg 3 connection pool (psycopg and psycopg-pool in requirements.txt); otherwise
+# each worker thread keeps its connection for DB_MAX_LIFETIME seconds and
+# checks that it is still alive before reusing it. Use the pool under ASGI,
+# where persistent connections are not reused across requests.
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+DB_MAX_LIFETIME = int(os.environ.get('DB_MAX_LIFETIME', '600'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -83,9 +102,142 @@ DATABASES = {
         'PASSWORD': '12345',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_MAX_LIFETIME,
+        'CONN_HEALTH_CHECKS': not DB_POOL,
+    }
+}
+
+if DB_POOL:
+    # Django falls back to psycopg2 without psycopg 3, and then fails on
+    # the first query rather than at startup
+    if not all(importlib.util.find_spec(module) for module in ('psycopg', 'psycopg_pool')):
+        raise ImproperlyConfigured('DB_POOL=1 needs psycopg 3 with its pool: pip install "psycopg[binary,pool]"')
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            # Seconds to wait for a free connection before failing the request
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'max_lifetime': DB_MAX_LIFETIME,
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        },
+    }
+
+# Read replicas: DB_REPLICA_HOSTS (comma-separated) become the aliases
+# replica1, replica2, ... with the primary's other settings. Views marked
+# @replica_reads read from them; see hospital/routers.py. To try routing
+# locally, add an alias that points at the same database as default.
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['hospital.routers.PrimaryReplicaRouter']
+
+REPLICA_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    # Reads stay on the primary this long after a client writes
+    'STICKY_SECONDS': int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '10')),
+    # Replicas further behind than this are skipped
+    'MAX_LAG_SECONDS': float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5')),
+    'LAG_CHECK_SECONDS': 5,
+    # Writes to these do not pin the client to the primary
+    'UNPINNED_MODELS': ['hospital.accesslog', 'sessions.session'],
+}
+
+
+# Access log writer: "sync", "commit" (flush at commit / end of request) or "async"
+AUDIT_LOG = {
+    'MODE': 'commit',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+# Access log partitions older than this are archived by
+# `manage.py maintain_accesslog_partitions --archive`
+ACCESS_LOG_RETENTION_MONTHS = 12
+ACCESS_LOG_ARCHIVE_DIR = BASE_DIR / 'archive' / 'accesslog'
+
+# In-process cache of consent answers (see hospital/consents.py), kept
+# current through per-doctor versions in the default cache. TTL only bounds
+# how late other processes see a change when that cache is not shared
+CONSENT_CACHE = {
+    'MAX_ENTRIES': 100000,
+    'TTL': 30,
+}
+
+# Fernet keys for medical histories, newest first (comma-separated in the env).
+# To rotate: prepend a new key, deploy, run `manage.py rotate_medical_history_keys`,
+# then drop the old key.
+MEDICAL_HISTORY_KEYS = os.environ.get(
+    'MEDICAL_HISTORY_KEYS',
+    'go2vz-2S-EklURltX8XkusMLnegRlCTBBbXg8_bhrJk=',
+).split(',')
+
+# HMAC key of the blind indexes used for exact lookups (Patient.contact_index).
+# Required outside DEBUG: phone numbers are few enough to brute-force offline
+# with a known key. Keep it separate from the Fernet keys; to rotate, set the
+# new key and run `manage.py backfill_contact_index --all`.
+BLIND_INDEX_KEY = os.environ.get('BLIND_INDEX_KEY', '')
+if not BLIND_INDEX_KEY:
+    if not DEBUG:
+        raise ImproperlyConfigured('Set BLIND_INDEX_KEY, e.g. to the output of python -c "import secrets; print(secrets.token_hex(32))"')
+    # Development only, derived from the (equally public) development SECRET_KEY
+    BLIND_INDEX_KEY = hashlib.sha256(f'blind-index:{SECRET_KEY}'.encode()).hexdigest()
+
+# Unwrapped per-patient data keys kept in memory (LRU)
+DATA_KEY_CACHE_SIZE = 10000
+
+# How far back `graph/data/?since=<version>` delta syncs can reach
+GRAPH_SYNC_WINDOW_DAYS = 30
+
+# Lifetime of the cached specialization/doctor cluster summary of the graph
+GRAPH_CLUSTER_CACHE_SECONDS = 300
+
+# Bounded cache of decrypted medical histories (see hospital/crypto.py)
+MEDICAL_HISTORY_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 1000,
+    'MAX_BYTES': 4 * 1024 * 1024,
+    'TTL': 60,
+}
+
+# How long a user's Doctor/Patient profile ids are cached (see hospital/roles.py)
+ROLE_CACHE_SECONDS = 300
+
+# Lifetime of cached admin dashboard pages; consent/doctor/patient changes clear them earlier
+ADMIN_DASHBOARD_CACHE_SECONDS = 60
+
+# Lifetime of cached dashboard fragments; data changes replace them earlier
+# through version bumps (see hospital/fragments.py)
+FRAGMENT_CACHE_SECONDS = 3600
+# Cap on that lifetime while the cache is per process (no CACHE_URL): a
+# version bump then only reaches the process that made the change
+FRAGMENT_LOCAL_CACHE_SECONDS = 5
+
+# Cache shared by every worker process, e.g. CACHE_URL=redis://127.0.0.1:6379/0.
+# Without it each process keeps its own in-memory cache, and invalidations
+# (fragment versions, roles, the admin dashboard) only reach the process
+# that made the change.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
     }
+
+# Request metrics served at /metrics/ (see hospital/metrics.py). Set
+# SLOW_REQUEST_SECONDS to log slower requests with their SQL to the
+# "hospital.slow_requests" logger.
+METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_SECONDS': None,
+    'SLOW_REQUEST_MAX_QUERIES': 100,
 }
 
+# Clinic opening hours used when searching for free appointment slots
+CLINIC_DAY_START = datetime.time(9, 0)
+CLINIC_DAY_END = datetime.time(17, 0)
 
 
 # Password validation
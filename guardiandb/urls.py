@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from hospital.admin import admin_site
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # GuardianDB admin with the doctor/patient dashboard at hospital-admin/dashboard/
+    path('hospital-admin/', admin_site.urls),
     path('', include('hospital.urls')),
 ]
@@ -1,14 +1,30 @@
 from django.contrib import admin
+from django.db.models import Q
 from .models import Patient, Doctor, Consent, AccessLog
+from . import dashboard
+from . import search
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
     list_display = ('name', 'age', 'contact')
-    search_fields = ('name', 'contact')
+    # Names are searched by word; contacts only by exact number (blind index)
+    search_fields = ('name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Ranked trigram / full-text search instead of icontains scans
+        if not search_term:
+            return queryset, False
+        return search.patient_matches(queryset, search_term), False
 
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ('name', 'specialization')
+    search_fields = ('name', 'specialization')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.doctor_matches(queryset, search_term), False
 
 @admin.register(Consent)
 class ConsentAdmin(admin.ModelAdmin):
@@ -20,8 +36,24 @@ class AccessLogAdmin(admin.ModelAdmin):
     list_display = ('action', 'patient', 'doctor', 'user', 'timestamp')
     search_fields = ('patient__name', 'doctor__name', 'user__username', 'action')
     list_filter = ('timestamp',)
+    # Counting the whole (partitioned) log on every changelist page is the slow part
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Match names through the indexed search, not icontains over joins
+        if not search_term:
+            return queryset, False
+        patients = search.patient_matches(Patient.objects.all(), search_term).values('id')
+        doctors = search.doctor_matches(Doctor.objects.all(), search_term).values('id')
+        return queryset.filter(
+            Q(patient_id__in=patients)
+            | Q(doctor_id__in=doctors)
+            | Q(user__username__istartswith=search_term)
+            | Q(action__icontains=search_term)
+        ), False
 
 from django.urls import path
+from django.http import Http404
 from django.shortcuts import render
 
 class MyAdminSite(admin.AdminSite):
@@ -35,15 +67,21 @@ class MyAdminSite(admin.AdminSite):
         return custom_urls + urls
 
     def dashboard_view(self, request):
-        # Prepare data: which patients are under which doctor
-        data = []
-        doctors = Doctor.objects.all()
-        for doctor in doctors:
-            patients = [consent.patient.name for consent in Consent.objects.filter(doctor=doctor, granted=True)]
-            data.append({'doctor': doctor.name, 'patients': patients})
+        # Which patients are under which doctor, a page of doctors at a time;
+        # ?doctor=<id> pages through one doctor's full list
+        page = request.GET.get('page', 1)
+        doctor_id = request.GET.get('doctor')
+        if doctor_id and doctor_id.isdigit():
+            data = dashboard.doctor_patients_page(int(doctor_id), page)
+            if data is None:
+                raise Http404("No such doctor")
+        else:
+            data = dashboard.doctors_page(page)
+
         context = dict(
             self.each_context(request),
-            data=data
+            title="Doctors and their patients",
+            **data
         )
         return render(request, "admin/hospital/dashboard.html", context)
 
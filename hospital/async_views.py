@@ -0,0 +1,143 @@
+"""
+Async versions of the read-only JSON endpoints.
+
+They return the same responses as their counterparts in views.py but
+use the async ORM and cache APIs, so under ASGI (guardiandb/asgi.py) a
+request waiting on the database does not hold a worker thread. Under
+WSGI use the sync views; Django would run these through
+``async_to_sync`` there.
+
+Role attributes (``request.doctor_id`` ...) come from RoleMiddleware,
+which resolves them asynchronously under ASGI; the user is read with
+``request.auser()``.
+"""
+
+import datetime
+from functools import wraps
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import graph
+from .routers import replica_reads
+from .views import (
+    CALENDAR_SUMMARY, GRAPH_CLUSTER_MAX_PAGE_SIZE, GRAPH_CLUSTER_PAGE_SIZE, NO_APPOINTMENTS,
+    calendar_etag_for, calendar_events, calendar_rows, calendar_window,
+)
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """``django.views.decorators.http.condition`` for coroutine etag / last-modified functions."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            last_modified = None
+            if last_modified_func:
+                if moment := await last_modified_func(request, *args, **kwargs):
+                    if not timezone.is_aware(moment):
+                        moment = timezone.make_aware(moment, datetime.timezone.utc)
+                    last_modified = int(moment.timestamp())
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag is not None else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+        return inner
+    return decorator
+
+
+#  Calendar feed
+async def _calendar_appointments(request):
+    if not hasattr(request, "calendar_appointments"):
+        appointments = calendar_window(request.doctor_id, request.GET)
+        if request.doctor_id is None:
+            summary = NO_APPOINTMENTS
+        else:
+            summary = await appointments.aaggregate(**CALENDAR_SUMMARY)
+        request.calendar_appointments = (appointments, summary)
+    return request.calendar_appointments
+
+
+async def _calendar_etag(request):
+    try:
+        _, summary = await _calendar_appointments(request)
+    except ValueError:
+        return None
+    user = await request.auser()
+    return calendar_etag_for(user.id, summary)
+
+
+# ETag only: Last-Modified (the newest updated_at) would not move when an
+# appointment is deleted, so If-Modified-Since could revalidate a stale feed
+@acondition(etag_func=_calendar_etag)
+async def appointments_json(request):
+    try:
+        appointments, _ = await _calendar_appointments(request)
+    except ValueError:
+        return JsonResponse({"error": "Invalid start or end"}, status=400)
+
+    rows = [row async for row in calendar_rows(appointments)]
+    return JsonResponse(calendar_events(rows), safe=False)
+
+
+#  Graph data: streaming full graph and delta sync
+async def _graph_etag(request):
+    request.graph_version = await graph.agraph_state()
+    mode = "delta" if "since" in request.GET else "full"
+    return f'"{mode}-{request.graph_version}"'
+
+
+@replica_reads
+@login_required
+@acondition(etag_func=_graph_etag)
+async def doctor_patient_graph_data(request):
+    version = request.graph_version
+
+    if "since" in request.GET:
+        try:
+            since = graph.from_version(request.GET["since"])
+        except (ValueError, OverflowError):
+            return JsonResponse({"error": "Invalid version"}, status=400)
+
+        if since < timezone.now() - graph.sync_window():
+            return JsonResponse({"version": version, "reset": True})
+
+        return JsonResponse({"version": version, "reset": False, **await graph.agraph_delta(since)})
+
+    response = StreamingHttpResponse(
+        graph.astream_json_array(graph.aiter_graph_elements()),
+        content_type="application/json",
+    )
+    response["X-Graph-Version"] = version
+    return response
+
+
+#  Aggregated graph used by the dashboard
+@login_required
+async def doctor_patient_graph_clusters(request):
+    return JsonResponse(await graph.acluster_summary(), safe=False)
+
+
+@replica_reads
+@login_required
+async def doctor_patient_graph_cluster_patients(request, doctor_id):
+    try:
+        after = int(request.GET.get("cursor", 0))
+        limit = int(request.GET.get("limit", GRAPH_CLUSTER_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    limit = max(1, min(limit, GRAPH_CLUSTER_MAX_PAGE_SIZE))
+
+    elements, next_cursor = await graph.acluster_patients(doctor_id, after, limit)
+    return JsonResponse({"elements": elements, "next": next_cursor})
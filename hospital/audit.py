@@ -0,0 +1,246 @@
+"""
+Buffered writer for ``AccessLog`` entries.
+
+Views call ``audit.record(...)`` instead of ``AccessLog.objects.create``.
+Entries are queued per process and written with ``bulk_create``, so a
+page view no longer pays for its own INSERT round trip.
+
+An entry recorded inside a transaction joins the shared queue only when
+that transaction commits (``on_commit``), and is dropped if it rolls
+back. The queue therefore only holds entries of committed work, and a
+flush never runs inside a request's transaction, so one request's
+rollback cannot take other requests' entries with it.
+
+Configured through ``settings.AUDIT_LOG``:
+
+    AUDIT_LOG = {
+        "MODE": "commit",       # "sync", "commit" or "async"
+        "BATCH_SIZE": 100,      # flush once this many entries are queued
+        "FLUSH_INTERVAL": 2.0,  # ... or once the oldest entry is this old (seconds)
+    }
+
+Modes:
+    sync    every entry is inserted immediately (previous behaviour)
+    commit  entries are flushed when the surrounding transaction commits,
+            at the end of each request (``AuditFlushMiddleware``) and on
+            the size/time thresholds
+    async   a background thread flushes on the thresholds; requests never
+            wait for the audit INSERT
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics
+from .models import AccessLog
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sync", "commit", "async")
+
+DEFAULTS = {
+    "MODE": "commit",
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL": 2.0,
+}
+
+
+class AuditWriter:
+    def __init__(self, mode="commit", batch_size=100, flush_interval=2.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown audit log mode {mode!r}, expected one of {MODES}")
+
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.max_queue_depth = 0
+        self.entries_written = 0
+        self.entries_failed = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        conf = {**DEFAULTS, **getattr(settings, "AUDIT_LOG", {})}
+        return cls(
+            mode=conf["MODE"],
+            batch_size=conf["BATCH_SIZE"],
+            flush_interval=conf["FLUSH_INTERVAL"],
+        )
+
+    # Recording
+
+    def record(self, **fields):
+        """Queue one AccessLog entry (``user``, ``doctor``, ``patient``, ``action``)."""
+        entry = AccessLog(**fields)
+
+        if self.mode == "sync":
+            entry.save()
+            with self._lock:
+                self.entries_written += 1
+            return
+
+        if transaction.get_connection().in_atomic_block:
+            # Only once the work it records is committed
+            transaction.on_commit(lambda: self._enqueue(entry, committed=True))
+        else:
+            self._enqueue(entry)
+
+    def _enqueue(self, entry, committed=False):
+        with self._lock:
+            self._queue.append(entry)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            depth = len(self._queue)
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            due = depth >= self.batch_size or self._overdue()
+
+        if self.mode == "async":
+            self._ensure_thread()
+            if due:
+                self._wakeup.set()
+            return
+
+        if due or committed:
+            self.flush()
+
+    def _overdue(self):
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+
+    # Flushing
+
+    def flush(self):
+        """Write every queued entry. Returns the number of entries written."""
+        if transaction.get_connection().in_atomic_block:
+            # The shared batch is written on its own, never as part of the
+            # caller's transaction
+            transaction.on_commit(self.flush)
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue, self._oldest = self._queue, [], None
+
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            written = self._write(batch)
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.flushes += 1
+                self.entries_written += written
+                self.entries_failed += len(batch) - written
+                self.last_flush_seconds = elapsed
+                self.total_flush_seconds += elapsed
+
+            return written
+
+    def _write(self, batch):
+        try:
+            AccessLog.objects.bulk_create(batch, batch_size=self.batch_size)
+            return len(batch)
+        except Exception:
+            # e.g. a patient deleted before the batch was written;
+            # fall back to row-by-row so one bad entry does not lose the rest
+            logger.exception("Audit log batch insert failed, retrying %d entries one by one", len(batch))
+
+        written = 0
+        for entry in batch:
+            entry.pk = None
+            try:
+                entry.save()
+                written += 1
+            except Exception:
+                logger.exception("Dropping audit log entry %r", entry.action)
+        return written
+
+    # Background thread (async mode)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Audit log background flush failed")
+
+    # Metrics
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self.max_queue_depth,
+                "entries_written": self.entries_written,
+                "entries_failed": self.entries_failed,
+                "flushes": self.flushes,
+                "last_flush_seconds": self.last_flush_seconds,
+                "total_flush_seconds": self.total_flush_seconds,
+            }
+
+
+writer = AuditWriter.from_settings()
+atexit.register(writer.flush)
+
+
+def record(**fields):
+    metrics.note_audit_entry()
+    writer.record(**fields)
+
+
+def flush():
+    return writer.flush()
+
+
+class AuditFlushMiddleware:
+    """Write queued audit entries once the response has been produced."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if writer.mode == "commit":
+            writer.flush()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if writer.mode == "commit":
+            await sync_to_async(writer.flush)()
+        return response
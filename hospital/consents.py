@@ -0,0 +1,125 @@
+"""
+Cached consent lookups.
+
+``consent_index.has_consent(doctor_id, patient_id)`` answers the hot
+authorization check from an in-process LRU of ``(doctor, patient)``
+answers, at most ``MAX_ENTRIES`` of them. A missing answer is loaded with
+one ``exists()`` on the ``(doctor, patient)`` unique index.
+
+Each answer is stored with its doctor's version number, kept in the
+default cache next to a global one. Saving or deleting one of a doctor's
+``Consent`` rows bumps that doctor's version (see ``hospital.signals``),
+so every process drops its answers for the doctor at the next lookup,
+which costs one cache read and no query while nothing changed. Both
+grants and revocations therefore take effect at once everywhere, as long
+as the cache is shared (``CACHE_URL``); with a per-process cache, answers
+are kept for at most ``TTL`` seconds, which bounds how late other
+processes see a change.
+
+Queryset ``update()``/``bulk_create()`` bypass signals; call
+``consent_index.invalidate()`` after using them on ``Consent``.
+
+Configured through ``settings.CONSENT_CACHE``:
+
+    CONSENT_CACHE = {"MAX_ENTRIES": 100000, "TTL": 30}
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import Consent
+
+DEFAULTS = {
+    "MAX_ENTRIES": 100000,
+    "TTL": 30,
+}
+
+ALL_DOCTORS = "all"
+
+
+def _version_key(doctor_id):
+    return f"consents:version:{doctor_id}"
+
+
+class ConsentIndex:
+    def __init__(self, max_entries=100000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (doctor_id, patient_id) -> (version, loaded_at, granted)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # answers dropped because their doctor's version moved
+
+    @classmethod
+    def from_settings(cls):
+        conf = {**DEFAULTS, **getattr(settings, "CONSENT_CACHE", {})}
+        return cls(max_entries=conf["MAX_ENTRIES"], ttl=conf["TTL"])
+
+    def _version(self, doctor_id):
+        keys = [_version_key(ALL_DOCTORS), _version_key(doctor_id)]
+        found = cache.get_many(keys)
+        for key in set(keys) - found.keys():
+            # From the clock, like fragment versions, so an evicted version
+            # never comes back to a number old answers are stored under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        return tuple(found[key] for key in keys)
+
+    def _expired(self, loaded_at, now):
+        # Versions bumped in other processes only reach us through a shared cache
+        return isinstance(caches["default"], LocMemCache) and now - loaded_at >= self.ttl
+
+    def has_consent(self, doctor_id, patient_id):
+        """Whether ``patient_id`` grants ``doctor_id`` access."""
+        if doctor_id is None:
+            return False
+        key = (doctor_id, patient_id)
+        version = self._version(doctor_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version and not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self.stale += 1
+            self.misses += 1
+
+        granted = Consent.objects.filter(doctor_id=doctor_id, patient_id=patient_id, granted=True).exists()
+
+        # Stored under the version read before the query: a change racing
+        # with it has bumped the version, so the answer is reloaded next time
+        with self._lock:
+            self._entries[key] = (version, now, granted)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return granted
+
+    def invalidate(self, doctor_id=None):
+        """Forget one doctor's consents, or every doctor's when ``doctor_id`` is None, in every process."""
+        key = _version_key(ALL_DOCTORS if doctor_id is None else doctor_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries_cached": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
+
+
+consent_index = ConsentIndex.from_settings()
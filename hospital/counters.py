@@ -0,0 +1,270 @@
+"""
+Maintained patient counters.
+
+``Doctor.patient_count`` is the number of patients who granted consent to
+the doctor; ``SpecializationCount.patient_count`` the number of patients
+who granted consent to at least one doctor of that specialization. The
+signals in signals.py update them whenever a ``Consent`` is created,
+toggled or deleted (cascades from deleting a patient or doctor included),
+inside the same transaction as the change.
+
+Bulk writes (``bulk_create``, ``update()``, raw SQL) bypass the signals;
+run ``reconcile()`` (or ``manage.py reconcile_patient_counters``) after them.
+"""
+
+import threading
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Consent, Doctor, SpecializationCount
+
+# Patient names shown with each doctor's count on the charts
+PREVIEW_PATIENTS = 5
+
+
+# Keeping the counters current (called from signals.py). A consent counts
+# towards its doctor and specialization while it is granted;
+# ``consent._counted`` is the (doctor_id, patient_id) the counters include
+# it under, or None.
+
+def _counted(consent):
+    return (consent.doctor_id, consent.patient_id) if consent.granted else None
+
+
+def consent_saving(consent):
+    """Remember what the counters currently include for ``consent``."""
+    if consent._state.adding:
+        consent._counted = None
+    elif not hasattr(consent, '_counted'):
+        stored = Consent.objects.filter(pk=consent.pk).values_list('doctor_id', 'patient_id', 'granted').first()
+        consent._counted = stored[:2] if stored and stored[2] else None
+
+
+def consent_saved(consent):
+    before, after = consent._counted, _counted(consent)
+    consent._counted = after
+    if before == after:
+        return
+    with transaction.atomic():
+        # A changed doctor or patient moves the consent: out of the old
+        # pair's counters, into the new one's
+        if before:
+            _add_to_doctor(before[0], -1)
+        if after:
+            _add_to_doctor(after[0], 1)
+        left = before and (before[1], _specialization(before[0]))
+        joined = after and (after[1], _specialization(after[0]))
+        if left != joined:
+            if left:
+                _patient_left(*left)
+            if joined:
+                _patient_joined(*joined)
+
+
+# A patient's or doctor's cascade, like a queryset delete(), sends every
+# pre_delete before removing any row and every post_delete after removing
+# them all. Each (patient, specialization) is settled once, after the last
+# of its consents in the batch is gone; otherwise each row would find the
+# patient's other consents already deleted and decrement again.
+_deleting = threading.local()
+
+
+def _pending():
+    if not hasattr(_deleting, 'batches'):
+        _deleting.batches = {}
+    return _deleting.batches
+
+
+def consent_deleting(consent, origin):
+    counted = consent._counted if hasattr(consent, '_counted') else _counted(consent)
+    if counted is None:
+        consent._deleting = None
+        return
+    doctor_id, patient_id = counted
+    # Keyed by the delete() call, so a failed delete leaves nothing behind
+    # for the next one
+    key = (id(origin), patient_id, _specialization(doctor_id))
+    consent._deleting = (doctor_id, key)
+    pending = _pending()
+    pending[key] = pending.get(key, 0) + 1
+
+
+def consent_deleted(consent):
+    deleting = getattr(consent, '_deleting', None)
+    if deleting is None:
+        return
+    doctor_id, key = deleting
+    with transaction.atomic():
+        _add_to_doctor(doctor_id, -1)
+        pending = _pending()
+        pending[key] -= 1
+        if pending[key] == 0:
+            del pending[key]
+            _patient_left(key[1], key[2])
+
+
+def _specialization(doctor_id):
+    return Doctor.objects.filter(pk=doctor_id).values_list('specialization', flat=True).first()
+
+
+def _add_to_doctor(doctor_id, delta):
+    doctors = Doctor.objects.filter(pk=doctor_id)
+    if delta < 0:
+        # A counter that drifted (see reconcile) must not fail the write
+        doctors = doctors.filter(patient_count__gt=0)
+    doctors.update(patient_count=F('patient_count') + delta)
+
+
+def _granted_in(patient_id, specialization):
+    """Doctors of ``specialization`` the patient has granted consent to."""
+    return Consent.objects.filter(patient_id=patient_id, granted=True, doctor__specialization=specialization).count()
+
+
+def _patient_joined(patient_id, specialization):
+    if specialization is None:
+        return
+    # Lock the specialization's row so concurrent changes for the same
+    # patient see each other's consents before deciding
+    counter, _ = SpecializationCount.objects.select_for_update().get_or_create(specialization=specialization)
+    if _granted_in(patient_id, specialization) == 1:
+        SpecializationCount.objects.filter(pk=counter.pk).update(patient_count=F('patient_count') + 1)
+
+
+def _patient_left(patient_id, specialization):
+    if specialization is None:
+        return
+    counter, _ = SpecializationCount.objects.select_for_update().get_or_create(specialization=specialization)
+    if _granted_in(patient_id, specialization) == 0:
+        (SpecializationCount.objects
+         .filter(pk=counter.pk, patient_count__gt=0)
+         .update(patient_count=F('patient_count') - 1))
+
+
+def doctor_saving(doctor):
+    """Note a specialization change, to recount both specializations after the save."""
+    doctor._previous_specialization = None
+    if doctor._state.adding:
+        return
+    specialization = Doctor.objects.filter(pk=doctor.pk).values_list('specialization', flat=True).first()
+    if specialization is not None and specialization != doctor.specialization:
+        doctor._previous_specialization = specialization
+
+
+def doctor_saved(doctor):
+    if getattr(doctor, '_previous_specialization', None) is not None:
+        specialization_changed(doctor, doctor._previous_specialization)
+
+
+def specialization_changed(doctor, previous):
+    """Recount both specializations after ``doctor`` moved from ``previous``."""
+    with transaction.atomic():
+        for specialization in (previous, doctor.specialization):
+            SpecializationCount.objects.update_or_create(
+                specialization=specialization,
+                defaults={'patient_count': _count_specialization(specialization)},
+            )
+
+
+def _count_specialization(specialization):
+    return (
+        Consent.objects
+        .filter(granted=True, doctor__specialization=specialization)
+        .aggregate(n=Count('patient_id', distinct=True))['n']
+    )
+
+
+# Reading
+
+def chart_data():
+    """
+    Per-doctor patient counts for the bar charts, in doctor id order, as
+    ``{'doctor', 'count', 'preview'}`` with up to ``PREVIEW_PATIENTS``
+    patient names. One row per doctor.
+    """
+    doctors = Doctor.objects.order_by('id')
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.expressions import ArraySubquery
+
+        # A LIMITed subquery per doctor on the (doctor, patient) index
+        preview = ArraySubquery(
+            Consent.objects
+            .filter(doctor_id=OuterRef('pk'), granted=True)
+            .order_by('patient_id')
+            .values('patient__name')[:PREVIEW_PATIENTS]
+        )
+        return [
+            {'doctor': name, 'count': count, 'preview': names}
+            for name, count, names in doctors.annotate(preview=preview).values_list('name', 'patient_count', 'preview')
+        ]
+
+    rows = list(doctors.values_list('id', 'name', 'patient_count'))
+    previews = {doctor_id: [] for doctor_id, _, _ in rows}
+    first_patients = (
+        Consent.objects
+        .filter(granted=True)
+        .annotate(position=Window(RowNumber(), partition_by=F('doctor_id'), order_by=F('patient_id').asc()))
+        .filter(position__lte=PREVIEW_PATIENTS)
+        .order_by('doctor_id', 'position')
+        .values_list('doctor_id', 'patient__name')
+    )
+    for doctor_id, name in first_patients:
+        previews.setdefault(doctor_id, []).append(name)
+    return [{'doctor': name, 'count': count, 'preview': previews[doctor_id]} for doctor_id, name, count in rows]
+
+
+# Repair
+
+def reconcile(dry_run=False):
+    """
+    Recompute every counter from the consents and fix the ones that
+    drifted. Returns the fixes as ``(kind, key, stored, actual)`` tuples,
+    ``kind`` being ``'doctor'`` or ``'specialization'``.
+    """
+    fixes = []
+    with transaction.atomic():
+        # Lock the counters first: consent changes committing meanwhile
+        # apply their own update once we are done
+        doctors = list(Doctor.objects.select_for_update().only('id', 'patient_count'))
+        stored = {c.specialization: c for c in SpecializationCount.objects.select_for_update()}
+
+        actual = dict(
+            Doctor.objects
+            .annotate(actual=Count('consent', filter=Q(consent__granted=True)))
+            .values_list('id', 'actual')
+        )
+        drifted = []
+        for doctor in doctors:
+            if doctor.patient_count != actual[doctor.id]:
+                fixes.append(('doctor', doctor.id, doctor.patient_count, actual[doctor.id]))
+                doctor.patient_count = actual[doctor.id]
+                drifted.append(doctor)
+
+        actual = dict(
+            Consent.objects
+            .filter(granted=True)
+            .values_list('doctor__specialization')
+            .annotate(n=Count('patient_id', distinct=True))
+            .order_by()
+        )
+        drifted_specializations = []
+        for specialization in sorted(set(actual) | set(stored)):
+            count = actual.get(specialization, 0)
+            counter = stored.get(specialization)
+            if counter is None:
+                fixes.append(('specialization', specialization, None, count))
+                drifted_specializations.append(SpecializationCount(specialization=specialization, patient_count=count))
+            elif counter.patient_count != count:
+                fixes.append(('specialization', specialization, counter.patient_count, count))
+                counter.patient_count = count
+                drifted_specializations.append(counter)
+
+        if not dry_run:
+            Doctor.objects.bulk_update(drifted, ['patient_count'], batch_size=1000)
+            SpecializationCount.objects.bulk_update(
+                [c for c in drifted_specializations if c.pk is not None], ['patient_count'], batch_size=1000,
+            )
+            SpecializationCount.objects.bulk_create([c for c in drifted_specializations if c.pk is None])
+    return fixes
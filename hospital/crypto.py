@@ -0,0 +1,297 @@
+"""
+Helpers for bulk work on encrypted medical histories.
+
+This module does not import Django models so that worker processes can
+import it cheaply (including under the "spawn" start method on Windows
+and macOS).
+"""
+
+import hashlib
+import hmac
+import itertools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# Batches smaller than this are decrypted in the calling process; the
+# cost of shipping tokens to workers outweighs the parallelism below it.
+PARALLEL_THRESHOLD = 1000
+CHUNK_SIZE = 500
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool shared by bulk encryption jobs, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _pool
+
+
+def chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def multi_fernet(keys):
+    """MultiFernet over ``keys``, newest first; the first key encrypts."""
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def unwrap_key(master, wrapped_key):
+    """Fernet for a patient's data key, unwrapped with the ``master`` MultiFernet."""
+    return Fernet(master.decrypt(wrapped_key.encode()))
+
+
+def decrypt_chunk(keys, items):
+    """
+    Decrypt ``(token, wrapped_key)`` pairs.
+
+    ``wrapped_key`` is the patient's data key wrapped by the master keys,
+    or empty for histories still encrypted directly with a master key.
+    """
+    master = multi_fernet(keys)
+    plaintexts = []
+    for token, wrapped_key in items:
+        fernet = unwrap_key(master, wrapped_key) if wrapped_key else master
+        plaintexts.append(fernet.decrypt(token.encode()).decode())
+    return plaintexts
+
+
+def decrypt_many(keys, items):
+    """Decrypt ``(token, wrapped_key)`` pairs, in worker processes for large batches."""
+    items = list(items)
+    if len(items) < PARALLEL_THRESHOLD or (os.cpu_count() or 1) < 2:
+        return decrypt_chunk(keys, items)
+
+    results = []
+    for plaintexts in get_pool().map(decrypt_chunk, itertools.repeat(keys), chunks(items)):
+        results.extend(plaintexts)
+    return results
+
+
+def encrypt_chunk(keys, texts):
+    """
+    Envelope-encrypt ``texts``, each under a new data key.
+
+    Returns ``(token, wrapped_key)`` pairs, the data key wrapped with the
+    primary (first) master key.
+    """
+    primary = Fernet(keys[0])
+    encrypted = []
+    for text in texts:
+        data_key = Fernet.generate_key()
+        encrypted.append((
+            Fernet(data_key).encrypt(text.encode()).decode(),
+            primary.encrypt(data_key).decode(),
+        ))
+    return encrypted
+
+
+def encrypt_many(keys, texts, pool=None, parallel=True):
+    """
+    Envelope-encrypt ``texts``, in worker processes for large batches
+    (``pool``, or the shared one); ``parallel=False`` always stays in-process.
+    """
+    texts = list(texts)
+    if not parallel or pool is None and (len(texts) < PARALLEL_THRESHOLD or (os.cpu_count() or 1) < 2):
+        return encrypt_chunk(keys, texts)
+
+    results = []
+    for encrypted in (pool or get_pool()).map(encrypt_chunk, itertools.repeat(keys), chunks(texts)):
+        results.extend(encrypted)
+    return results
+
+
+def rotate_chunk(keys, rows):
+    """
+    Bring ``(pk, token, wrapped_key)`` rows up to date with the primary key.
+
+    Envelope-encrypted rows only have their small data key rewrapped with
+    the primary (first) master key; the history itself is untouched.
+    Rows without a data key are moved to envelope encryption: a new data
+    key is generated and the history re-encrypted with it.
+
+    Returns ``(pk, old_token, old_wrapped_key, new_token, new_wrapped_key)``
+    for the rows that changed.
+    """
+    primary = Fernet(keys[0])
+    master = multi_fernet(keys)
+
+    rotated = []
+    for pk, token, wrapped_key in rows:
+        if wrapped_key:
+            try:
+                primary.decrypt(wrapped_key.encode())
+                continue
+            except InvalidToken:
+                pass
+            new_wrapped_key = master.rotate(wrapped_key.encode()).decode()
+            rotated.append((pk, token, wrapped_key, token, new_wrapped_key))
+        else:
+            data_key = Fernet.generate_key()
+            plaintext = master.decrypt(token.encode())
+            new_token = Fernet(data_key).encrypt(plaintext).decode()
+            new_wrapped_key = primary.encrypt(data_key).decode()
+            rotated.append((pk, token, wrapped_key, new_token, new_wrapped_key))
+    return rotated
+
+
+class DataKeyCache:
+    """
+    LRU of unwrapped per-patient data keys, keyed by the wrapped key.
+
+    Saves the master-key decryption on every read of a hot patient.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # wrapped key -> Fernet
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, master, wrapped_key):
+        with self._lock:
+            fernet = self._entries.get(wrapped_key)
+            if fernet is not None:
+                self._entries.move_to_end(wrapped_key)
+                self.hits += 1
+                return fernet
+            self.misses += 1
+
+        fernet = unwrap_key(master, wrapped_key)
+        with self._lock:
+            self._entries[wrapped_key] = fernet
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fernet
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def normalize_contact(contact):
+    """Digits only, so "+91 98765-43210" and "919876543210" index the same."""
+    contact = contact or ""
+    digits = re.sub(r"\D", "", contact)
+    return digits or contact.strip().casefold()
+
+
+def blind_index(key, value):
+    """
+    Keyed HMAC-SHA256 of ``value`` as hex.
+
+    Equal values give equal indexes, so exact matches can be looked up
+    through an ordinary index, while the value cannot be recovered (or
+    guessed offline) without the key.
+    """
+    return hmac.new(key, value.encode(), hashlib.sha256).hexdigest()
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class PlaintextCache:
+    """
+    TTL + LRU cache of decrypted medical histories.
+
+    Keyed by ``(patient_id, sha256(token))`` so a re-encrypted history
+    never returns the old plaintext. Bounded both by entry count and by
+    total plaintext bytes. Plaintexts are held in ``bytearray`` buffers
+    that are overwritten with zeros when evicted, expired or cleared;
+    the ``str`` copies handed to callers are ordinary Python strings and
+    are not covered by this.
+    """
+
+    def __init__(self, enabled=False, max_entries=1000, max_bytes=4 * 1024 * 1024, ttl=60):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (stored_at, bytearray)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, patient_id, token):
+        if not self.enabled:
+            return None
+
+        key = (patient_id, token_digest(token))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].decode()
+
+    def put(self, patient_id, token, plaintext):
+        if not self.enabled:
+            return
+
+        buffer = bytearray(plaintext.encode())
+        if len(buffer) > self.max_bytes:
+            _zero(buffer)
+            return
+
+        key = (patient_id, token_digest(token))
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (time.monotonic(), buffer)
+            self._bytes += len(buffer)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def _discard(self, key):
+        _, buffer = self._entries.pop(key)
+        self._bytes -= len(buffer)
+        _zero(buffer)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _zero(buffer):
+    buffer[:] = bytes(len(buffer))
@@ -0,0 +1,115 @@
+"""
+Data for the admin dashboard: doctors with the patients who granted
+them consent.
+
+Pages are built with a fixed number of queries whatever the hospital
+size: one query for a page of doctors with their maintained patient
+counts and one windowed query for the first few patients of each of them.
+Results are cached for ``ADMIN_DASHBOARD_CACHE_SECONDS`` under a
+version number that signals bump whenever a consent, doctor or patient
+changes.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Consent, Doctor
+
+DOCTORS_PER_PAGE = 25
+# Patients listed under each doctor on the overview; the rest are a click away
+PATIENTS_PER_DOCTOR = 10
+PATIENTS_PER_PAGE = 100
+
+VERSION_KEY = 'admin-dashboard:version'
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Not set yet (or evicted); nothing cached under it can be current
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _cached(key, build):
+    key = f'admin-dashboard:{_version()}:{key}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, getattr(settings, 'ADMIN_DASHBOARD_CACHE_SECONDS', 60))
+    return data
+
+
+def _page_info(page):
+    return {
+        'number': page.number,
+        'num_pages': page.paginator.num_pages,
+        'count': page.paginator.count,
+        'previous': page.previous_page_number() if page.has_previous() else None,
+        'next': page.next_page_number() if page.has_next() else None,
+    }
+
+
+def doctors_page(number):
+    """
+    A page of doctors as ``{'doctors': [...], 'page': {...}}``; each doctor
+    has ``id``, ``name``, ``specialization``, ``patient_count`` and the
+    first ``PATIENTS_PER_DOCTOR`` ``patients`` by name.
+    """
+    return _cached(f'doctors:{number}', lambda: _build_doctors_page(number))
+
+
+def _build_doctors_page(number):
+    # patient_count is maintained by hospital.counters
+    doctors = Doctor.objects.order_by('name', 'id').values('id', 'name', 'specialization', 'patient_count')
+    page = Paginator(doctors, DOCTORS_PER_PAGE).get_page(number)
+    rows = list(page.object_list)
+
+    first_patients = (
+        Consent.objects
+        .filter(doctor_id__in=[row['id'] for row in rows], granted=True)
+        .annotate(position=Window(
+            RowNumber(),
+            partition_by=F('doctor_id'),
+            order_by=[F('patient__name').asc(), F('patient_id').asc()],
+        ))
+        .filter(position__lte=PATIENTS_PER_DOCTOR)
+        .order_by('doctor_id', 'position')
+        .values_list('doctor_id', 'patient_id', 'patient__name')
+    )
+    patients = {row['id']: [] for row in rows}
+    for doctor_id, patient_id, name in first_patients:
+        patients[doctor_id].append({'id': patient_id, 'name': name})
+
+    for row in rows:
+        row['patients'] = patients[row['id']]
+        row['more'] = row['patient_count'] - len(row['patients'])
+    return {'doctors': rows, 'page': _page_info(page)}
+
+
+def doctor_patients_page(doctor_id, number):
+    """One doctor's consenting patients, a page at a time; None if there is no such doctor."""
+    return _cached(f'doctor:{doctor_id}:{number}', lambda: _build_doctor_patients_page(doctor_id, number))
+
+
+def _build_doctor_patients_page(doctor_id, number):
+    doctor = Doctor.objects.filter(id=doctor_id).values('id', 'name', 'specialization').first()
+    if doctor is None:
+        return None
+
+    patients = (
+        Consent.objects
+        .filter(doctor_id=doctor_id, granted=True)
+        .order_by('patient__name', 'patient_id')
+        .values('patient_id', 'patient__name')
+    )
+    page = Paginator(patients, PATIENTS_PER_PAGE).get_page(number)
+    doctor['patients'] = [{'id': row['patient_id'], 'name': row['patient__name']} for row in page.object_list]
+    return {'doctor': doctor, 'page': _page_info(page)}
@@ -0,0 +1,133 @@
+"""
+Streaming NDJSON export of patients, consents, appointments and access logs.
+
+Rows are read with ``QuerySet.iterator()``, which uses a server-side
+cursor on PostgreSQL, and encoded one chunk at a time, so memory use
+does not depend on the number of rows exported.
+"""
+
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import AccessLog, Appointment, Consent, EncryptionHelper, Patient
+
+CHUNK_SIZE = 2000
+# Lines are joined into blocks of roughly this many bytes before being yielded
+BLOCK_SIZE = 64 * 1024
+
+# entity -> (model, exported fields, date field for since/until, ordering)
+ENTITIES = {
+    "patients": (
+        Patient,
+        ["id", "name", "age", "address", "contact"],
+        None,
+        ["id"],
+    ),
+    "consents": (
+        Consent,
+        ["id", "patient_id", "doctor_id", "granted", "updated_at"],
+        "updated_at",
+        ["id"],
+    ),
+    "appointments": (
+        Appointment,
+        ["id", "patient_id", "doctor_id", "appointment_date", "duration_minutes", "ends_at", "notes", "created_at", "updated_at"],
+        "appointment_date",
+        ["id"],
+    ),
+    "access_logs": (
+        AccessLog,
+        ["id", "timestamp", "action", "user_id", "doctor_id", "patient_id"],
+        "timestamp",
+        ["timestamp", "id"],
+    ),
+}
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def export_queryset(entity, patient=None, doctor=None, since=None, until=None):
+    model, fields, date_field, ordering = ENTITIES[entity]
+    rows = model.objects.order_by(*ordering)
+
+    if entity == "patients":
+        if patient is not None:
+            rows = rows.filter(id=patient)
+        if doctor is not None:
+            # Patients who granted the doctor access
+            rows = rows.filter(consent__doctor_id=doctor, consent__granted=True)
+    else:
+        if patient is not None:
+            rows = rows.filter(patient_id=patient)
+        if doctor is not None:
+            rows = rows.filter(doctor_id=doctor)
+
+    if date_field and since is not None:
+        rows = rows.filter(**{f"{date_field}__gte": since})
+    if date_field and until is not None:
+        rows = rows.filter(**{f"{date_field}__lt": until})
+    return rows
+
+
+def export_rows(entity, histories=False, chunk_size=CHUNK_SIZE, **filters):
+    """Yield the exported rows of ``entity`` as dicts."""
+    _, fields, _, _ = ENTITIES[entity]
+    with_histories = histories and entity == "patients"
+    if with_histories:
+        fields = fields + ["encrypted_medical_history", "wrapped_data_key"]
+
+    rows = export_queryset(entity, **filters).values_list(*fields).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for row in rows:
+        chunk.append(dict(zip(fields, row)))
+        if len(chunk) == chunk_size:
+            yield from _finish(chunk, with_histories)
+            chunk = []
+    yield from _finish(chunk, with_histories)
+
+
+def _finish(chunk, with_histories):
+    if with_histories:
+        # Decrypt a whole chunk at once so large exports use the process pool
+        texts = EncryptionHelper.decrypt_many(
+            [row.pop("encrypted_medical_history") for row in chunk],
+            [row.pop("wrapped_data_key") for row in chunk],
+        )
+        for row, text in zip(chunk, texts):
+            row["medical_history"] = text
+    return chunk
+
+
+def iter_ndjson(rows):
+    """Encode rows as NDJSON, yielding blocks of bytes."""
+    block = []
+    size = 0
+    for row in rows:
+        line = (_encoder.encode(row) + "\n").encode()
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield b"".join(block)
+            block = []
+            size = 0
+    if block:
+        yield b"".join(block)
+
+
+def gzip_stream(blocks):
+    """Gzip a stream of byte blocks on the fly."""
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip container
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(entity, compress=False, **options):
+    """NDJSON bytes of ``entity``, optionally gzipped."""
+    blocks = iter_ndjson(export_rows(entity, **options))
+    return gzip_stream(blocks) if compress else blocks
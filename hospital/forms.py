@@ -26,7 +26,7 @@ class ConsentForm(forms.ModelForm):
 class AppointmentForm(forms.ModelForm):
     class Meta:
         model = Appointment
-        fields = ["patient", "doctor", "appointment_date", "notes"]
+        fields = ["patient", "doctor", "appointment_date", "duration_minutes", "notes"]
         widgets = {
             "appointment_date": forms.DateTimeInput(attrs={"type": "datetime-local"}),
         }
@@ -39,8 +39,6 @@ class DoctorRegisterForm(forms.Form):
     username = forms.CharField(max_length=50)
     password = forms.CharField(widget=forms.PasswordInput)
 
-from .models import EncryptionHelper
-
 
 class PatientRegistrationForm(forms.Form):
     username = forms.CharField(max_length=50)
@@ -58,14 +56,15 @@ class PatientRegistrationForm(forms.Form):
         )
 
         # Create patient linked to user
-        patient = Patient.objects.create(
+        patient = Patient(
             user=user,
             name=self.cleaned_data["name"],
             age=self.cleaned_data["age"],
             address=self.cleaned_data.get("address", ""),
             contact=self.cleaned_data["contact"],
-            encrypted_medical_history=EncryptionHelper.encrypt("No medical history yet.")
         )
+        patient.set_medical_history("No medical history yet.")
+        patient.save()
         return patient
 
 from django import forms
@@ -0,0 +1,87 @@
+"""
+Versioned caching of template fragments.
+
+Each cached fragment names the data domains it shows (``DOMAINS``) and is
+stored under their current version numbers. Signals bump a domain's
+version whenever one of its models changes, so a fragment is re-rendered
+after its data changes and served from the cache until then; no cache
+entry is ever deleted, stale ones simply stop being looked up.
+
+Templates use the ``{% fragment %}`` tag (templatetags/fragment_cache.py):
+
+    {% load fragment_cache %}
+    {% fragment "doctor-options" "doctors" %}...{% endfragment %}
+    {% fragment "doctor-patients" "patients,consents" request.doctor_id %}...{% endfragment %}
+
+Arguments after the domains become part of the cache key; a fragment whose
+content depends on the user must pass what it depends on (their role,
+doctor id, ...). Hits and misses are counted per fragment on /metrics/.
+
+Versions live in the default cache. With several worker processes it must
+be shared (``CACHE_URL``) for a change made in one process to reach the
+others; with a per-process cache, fragments are kept for at most
+``FRAGMENT_LOCAL_CACHE_SECONDS``, which bounds how stale other processes
+can be.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+DOMAINS = ('patients', 'doctors', 'consents', 'appointments')
+
+
+def _version_key(domain):
+    return f'fragments:version:{domain}'
+
+
+def versions(domains):
+    """``{domain: version}`` for ``domains``, starting any that are not set yet."""
+    keys = {_version_key(domain): domain for domain in domains}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        # Start from the clock rather than 1, so a version lost to eviction
+        # never comes back to a number that old fragments are stored under
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump(*domains):
+    for domain in domains:
+        try:
+            cache.incr(_version_key(domain))
+        except ValueError:
+            cache.set(_version_key(domain), time.time_ns(), None)
+
+
+def timeout():
+    seconds = getattr(settings, 'FRAGMENT_CACHE_SECONDS', 3600)
+    if isinstance(caches['default'], LocMemCache):
+        seconds = min(seconds, getattr(settings, 'FRAGMENT_LOCAL_CACHE_SECONDS', 5))
+    return seconds
+
+
+def fragment_key(name, versions, vary_on=()):
+    version = '.'.join(str(versions[domain]) for domain in sorted(versions))
+    vary = hashlib.md5(':'.join(str(value) for value in vary_on).encode()).hexdigest()
+    return f'fragments:{name}:{version}:{vary}'
+
+
+def get_or_render(name, versions, vary_on, render):
+    """The cached fragment, or ``render()``'s output, which is then cached."""
+    key = fragment_key(name, versions, vary_on)
+    labels = (('fragment', name),)
+    content = cache.get(key)
+    if content is None:
+        metrics.fragment_cache_misses.inc(labels)
+        content = render()
+        cache.set(key, content, timeout())
+    else:
+        metrics.fragment_cache_hits.inc(labels)
+    return content
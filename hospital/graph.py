@@ -0,0 +1,393 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Doctor, Patient, Consent, ConsentTombstone, GraphNodeChange, SpecializationCount
+
+
+# Doctor–patient graph API: streaming full graph and delta sync
+
+# Changes committed slightly out of updated_at order are still picked up
+# by re-sending this much history on every delta; applying an edge
+# twice is harmless.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def sync_window():
+    """How far back delta syncs can go; older clients must reload the full graph."""
+    return datetime.timedelta(days=getattr(settings, 'GRAPH_SYNC_WINDOW_DAYS', 30))
+
+
+def purge_tombstones(dry_run=False):
+    """
+    Delete consent tombstones and node changes older than the sync window;
+    returns how many there were.
+    """
+    cutoff = timezone.now() - sync_window()
+    expired = (
+        ConsentTombstone.objects.filter(deleted_at__lt=cutoff),
+        GraphNodeChange.objects.filter(changed_at__lt=cutoff),
+    )
+    if dry_run:
+        return sum(rows.count() for rows in expired)
+    return sum(rows.delete()[0] for rows in expired)
+
+
+# Fields shown on each kind of graph node
+NODE_FIELDS = {Doctor: {'name', 'specialization'}, Patient: {'name'}}
+
+
+def note_node_saved(instance, created, update_fields):
+    """Record a doctor or patient save that changes its graph node."""
+    if update_fields is not None and not NODE_FIELDS[type(instance)] & set(update_fields):
+        return
+    if isinstance(instance, Patient):
+        # New patients join the graph through their consents
+        if created or getattr(instance, '_graph_name', None) == instance.name:
+            return
+        instance._graph_name = instance.name
+    GraphNodeChange.objects.create(kind=_node_kind(instance), node_id=instance.pk)
+
+
+def note_node_deleted(instance):
+    GraphNodeChange.objects.create(kind=_node_kind(instance), node_id=instance.pk)
+
+
+def _node_kind(instance):
+    return 'doctor' if isinstance(instance, Doctor) else 'patient'
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def to_version(moment):
+    """Graph version: microseconds since the epoch of the latest change."""
+    return str((moment - EPOCH) // datetime.timedelta(microseconds=1)) if moment else "0"
+
+
+def from_version(version):
+    """Parse a version string; raises ValueError when it is not one."""
+    micros = int(version)
+    if micros < 0:
+        raise ValueError(version)
+    return EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def graph_state():
+    """
+    The graph version, which moves whenever a consent is saved or deleted
+    or a doctor or patient node changes. Three lookups of an indexed
+    maximum, whatever the table sizes.
+    """
+    return _graph_state(*(qs.aggregate(latest=Max(field)) for qs, field in _state_queries()))
+
+
+async def agraph_state():
+    """Async version of ``graph_state``."""
+    return _graph_state(*[await qs.aaggregate(latest=Max(field)) for qs, field in _state_queries()])
+
+
+def _state_queries():
+    return (
+        (Consent.objects, 'updated_at'),
+        (ConsentTombstone.objects, 'deleted_at'),
+        (GraphNodeChange.objects, 'changed_at'),
+    )
+
+
+def _graph_state(*states):
+    moments = [state['latest'] for state in states if state['latest']]
+    return to_version(max(moments) if moments else None)
+
+
+def doctor_element(doctor_id, name, specialization):
+    return {'data': {'id': f'doctor_{doctor_id}', 'label': f"{name} ({specialization})", 'type': 'doctor'}}
+
+
+def patient_element(patient_id, name):
+    return {'data': {'id': f'patient_{patient_id}', 'label': name, 'type': 'patient'}}
+
+
+def edge_id(patient_id, doctor_id):
+    return f'edge_{patient_id}_{doctor_id}'
+
+
+def edge_element(patient_id, doctor_id):
+    return {'data': {
+        'id': edge_id(patient_id, doctor_id),
+        'source': f'patient_{patient_id}',
+        'target': f'doctor_{doctor_id}',
+    }}
+
+
+def iter_graph_elements(chunk_size=2000):
+    """
+    Every doctor, then each consenting patient once followed by its edges.
+
+    Consents are read through a server-side cursor ordered by patient,
+    so a patient node is emitted on the first row for that patient and
+    memory stays constant whatever the graph size.
+    """
+    doctors, consents = _graph_queries()
+    for doctor_id, name, specialization in doctors.iterator(chunk_size=chunk_size):
+        yield doctor_element(doctor_id, name, specialization)
+
+    last_patient = None
+    for patient_id, patient_name, doctor_id in consents.iterator(chunk_size=chunk_size):
+        if patient_id != last_patient:
+            last_patient = patient_id
+            yield patient_element(patient_id, patient_name)
+        yield edge_element(patient_id, doctor_id)
+
+
+async def aiter_graph_elements(chunk_size=2000):
+    """Async version of ``iter_graph_elements``."""
+    # aiterator() over a plain values_list() runs its query on the event
+    # loop; named rows come from a real generator and unpack the same
+    doctors, consents = _graph_queries(named=True)
+    async for doctor_id, name, specialization in doctors.aiterator(chunk_size=chunk_size):
+        yield doctor_element(doctor_id, name, specialization)
+
+    last_patient = None
+    async for patient_id, patient_name, doctor_id in consents.aiterator(chunk_size=chunk_size):
+        if patient_id != last_patient:
+            last_patient = patient_id
+            yield patient_element(patient_id, patient_name)
+        yield edge_element(patient_id, doctor_id)
+
+
+def _graph_queries(named=False):
+    doctors = Doctor.objects.order_by('id').values_list('id', 'name', 'specialization', named=named)
+    consents = (
+        Consent.objects
+        .filter(granted=True)
+        .order_by('patient_id', 'doctor_id')
+        .values_list('patient_id', 'patient__name', 'doctor_id', named=named)
+    )
+    return doctors, consents
+
+
+def stream_json_array(elements):
+    """Encode an iterable as a JSON array, one element at a time."""
+    yield '['
+    first = True
+    for element in elements:
+        if not first:
+            yield ','
+        first = False
+        yield json.dumps(element)
+    yield ']'
+
+
+async def astream_json_array(elements):
+    """Async version of ``stream_json_array``, for an async iterable."""
+    yield '['
+    first = True
+    async for element in elements:
+        if not first:
+            yield ','
+        first = False
+        yield json.dumps(element)
+    yield ']'
+
+
+def graph_delta(since):
+    """
+    Changes after ``since`` (a datetime) as
+    ``{'added': [elements], 'removed': [element ids]}``.
+
+    Added elements include doctors and patients whose node changed, with
+    their current labels; removed ids include deleted doctors and
+    patients as well as edges. Added nodes may already exist on the
+    client (which then updates their label) and removed ones may already
+    be gone; clients apply both idempotently.
+    """
+    changes, tombstones, doctors, patients, changed_nodes = _delta_queries(since)
+    return _delta(changes.iterator(), tombstones.iterator(), list(doctors), list(patients), changed_nodes.iterator())
+
+
+async def agraph_delta(since):
+    """Async version of ``graph_delta``."""
+    changes, tombstones, doctors, patients, changed_nodes = _delta_queries(since)
+    return _delta(
+        [row async for row in changes],
+        [row async for row in tombstones],
+        [row async for row in doctors],
+        [row async for row in patients],
+        [row async for row in changed_nodes],
+    )
+
+
+def _delta_queries(since):
+    since = since - SYNC_OVERLAP
+
+    changes = (
+        Consent.objects
+        .filter(updated_at__gt=since)
+        .order_by('updated_at', 'id')
+        .values_list('patient_id', 'patient__name', 'doctor_id', 'granted')
+    )
+    tombstones = ConsentTombstone.objects.filter(deleted_at__gt=since).values_list('patient_id', 'doctor_id')
+    node_changes = GraphNodeChange.objects.filter(changed_at__gt=since)
+    # Doctors of new edges, and changed doctors that still exist
+    doctors = Doctor.objects.filter(
+        Q(id__in=Consent.objects.filter(updated_at__gt=since, granted=True).values('doctor_id'))
+        | Q(id__in=node_changes.filter(kind='doctor').values('node_id'))
+    ).values_list('id', 'name', 'specialization')
+    patients = Patient.objects.filter(
+        id__in=node_changes.filter(kind='patient').values('node_id')
+    ).values_list('id', 'name')
+    changed_nodes = node_changes.values_list('kind', 'node_id').distinct()
+    return changes, tombstones, doctors, patients, changed_nodes
+
+
+def _delta(changes, tombstones, doctors, patients, changed_nodes):
+    # Renamed patients come first; the client drops those left without edges
+    added = [patient_element(*patient) for patient in patients]
+    removed = []
+    seen_patients = {patient_id for patient_id, _ in patients}
+
+    for patient_id, patient_name, doctor_id, granted in changes:
+        if granted:
+            if patient_id not in seen_patients:
+                seen_patients.add(patient_id)
+                added.append(patient_element(patient_id, patient_name))
+            added.append(edge_element(patient_id, doctor_id))
+        else:
+            removed.append(edge_id(patient_id, doctor_id))
+
+    for patient_id, doctor_id in tombstones:
+        removed.append(edge_id(patient_id, doctor_id))
+
+    # Changed nodes that no longer exist were deleted
+    present = {('doctor', doctor[0]) for doctor in doctors} | {('patient', patient[0]) for patient in patients}
+    for kind, node_id in changed_nodes:
+        if (kind, node_id) not in present:
+            removed.append(f'{kind}_{node_id}')
+
+    added[:0] = [doctor_element(*doctor) for doctor in doctors]
+
+    return {'added': added, 'removed': removed}
+
+
+# Level-of-detail graph: cluster summary and per-doctor drill-down
+
+CLUSTER_CACHE_KEY = 'graph:clusters'
+
+
+def cluster_summary():
+    """
+    Top level of the aggregated graph: one node per specialization and
+    per doctor, each carrying its count of consenting patients, and an
+    edge from every doctor to its specialization.
+
+    Its size depends only on the number of doctors. Cached until a
+    doctor or consent changes (see ``hospital.signals``) or
+    ``GRAPH_CLUSTER_CACHE_SECONDS`` pass, whichever is first.
+    """
+    elements = cache.get(CLUSTER_CACHE_KEY)
+    if elements is None:
+        elements = build_cluster_summary()
+        cache.set(CLUSTER_CACHE_KEY, elements, _cluster_cache_seconds())
+    return elements
+
+
+async def acluster_summary():
+    """Async version of ``cluster_summary``."""
+    elements = await cache.aget(CLUSTER_CACHE_KEY)
+    if elements is None:
+        per_specialization, doctors = _cluster_queries()
+        elements = _cluster_elements(
+            {key: n async for key, n in per_specialization},
+            [row async for row in doctors],
+        )
+        await cache.aset(CLUSTER_CACHE_KEY, elements, _cluster_cache_seconds())
+    return elements
+
+
+def _cluster_cache_seconds():
+    return getattr(settings, 'GRAPH_CLUSTER_CACHE_SECONDS', 300)
+
+
+def invalidate_cluster_summary():
+    cache.delete(CLUSTER_CACHE_KEY)
+
+
+def build_cluster_summary():
+    per_specialization, doctors = _cluster_queries()
+    return _cluster_elements(dict(per_specialization), list(doctors))
+
+
+def _cluster_queries():
+    # Counts come from the maintained counters (hospital.counters)
+    per_specialization = SpecializationCount.objects.values_list('specialization', 'patient_count')
+    doctors = Doctor.objects.order_by('specialization', 'id').values_list('id', 'name', 'specialization', 'patient_count')
+    return per_specialization, doctors
+
+
+def _cluster_elements(per_specialization, doctors):
+    elements = []
+
+    for specialization in sorted({d[2] for d in doctors}):
+        count = per_specialization.get(specialization, 0)
+        elements.append({'data': {
+            'id': f'spec_{specialization}',
+            'label': f'{specialization} ({count})',
+            'type': 'specialization',
+            'count': count,
+        }})
+
+    for doctor_id, name, specialization, count in doctors:
+        elements.append({'data': {
+            'id': f'doctor_{doctor_id}',
+            'label': f'{name} ({count})',
+            'type': 'doctor',
+            'count': count,
+        }})
+        elements.append({'data': {
+            'id': f'member_{doctor_id}',
+            'source': f'doctor_{doctor_id}',
+            'target': f'spec_{specialization}',
+        }})
+
+    return elements
+
+
+def cluster_patients(doctor_id, after=0, limit=100):
+    """
+    One page of a doctor cluster's patients, as patient nodes and edges.
+
+    Pages are keyed on patient id and walk the (doctor, patient) unique
+    index. Returns ``(elements, next_cursor)``; ``next_cursor`` is None
+    on the last page.
+    """
+    return _cluster_page(doctor_id, list(_cluster_page_query(doctor_id, after, limit)), limit)
+
+
+async def acluster_patients(doctor_id, after=0, limit=100):
+    """Async version of ``cluster_patients``."""
+    rows = [row async for row in _cluster_page_query(doctor_id, after, limit)]
+    return _cluster_page(doctor_id, rows, limit)
+
+
+def _cluster_page_query(doctor_id, after, limit):
+    return (
+        Consent.objects
+        .filter(doctor_id=doctor_id, granted=True, patient_id__gt=after)
+        .order_by('patient_id')
+        .values_list('patient_id', 'patient__name')[:limit + 1]
+    )
+
+
+def _cluster_page(doctor_id, rows, limit):
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+
+    elements = []
+    for patient_id, name in rows[:limit]:
+        elements.append(patient_element(patient_id, name))
+        elements.append(edge_element(patient_id, doctor_id))
+    return elements, next_cursor
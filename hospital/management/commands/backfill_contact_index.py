@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill Patient.contact_index, the blind index used by "
+        "Patient.objects.by_contact(), in primary-key chunks. With --all every "
+        "row is recomputed, e.g. after changing BLIND_INDEX_KEY."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000,
+            help="Patients per chunk / write transaction (default: 2000).",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute every row, not only rows without an index.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        patients = Patient.objects.order_by("pk")
+        if not options["all"]:
+            patients = patients.filter(contact_index="")
+
+        started = time.perf_counter()
+        last_pk = 0
+        scanned = updated = 0
+        while True:
+            rows = list(patients.filter(pk__gt=last_pk).values_list("pk", "contact", "contact_index")[:chunk_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            changed = []
+            for pk, contact, current in rows:
+                index = Patient.contact_blind_index(contact)
+                if index != current:
+                    changed.append(Patient(pk=pk, contact_index=index))
+
+            with transaction.atomic():
+                Patient.objects.bulk_update(changed, ["contact_index"])
+
+            scanned += len(rows)
+            updated += len(changed)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Up to patient {last_pk}: {scanned} scanned, {updated} updated ({scanned / elapsed:.0f} rows/s)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {scanned} patients scanned, {updated} updated in {elapsed:.1f}s"
+        ))
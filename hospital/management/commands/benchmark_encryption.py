@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from cryptography.fernet import Fernet
+from django.core.management.base import BaseCommand
+
+from hospital import crypto
+from hospital.models import EncryptionHelper
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request medical history decryption latency of the direct "
+        "master-key scheme against envelope encryption (cold and cached data keys)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=2000, help="Distinct patients (default: 2000).")
+        parser.add_argument("--requests", type=int, default=20000, help="Simulated reads (default: 20000).")
+        parser.add_argument("--history-bytes", type=int, default=2048, help="Size of each history (default: 2048).")
+
+    def handle(self, *args, **options):
+        patients = options["patients"]
+        reads = options["requests"]
+        text = "x" * options["history_bytes"]
+        master = EncryptionHelper.fernet
+
+        # Direct scheme: history encrypted with the master key
+        direct = [master.encrypt(text.encode()).decode() for _ in range(patients)]
+
+        # Envelope scheme: per-patient data key wrapped by the master key
+        envelope = []
+        for _ in range(patients):
+            data_key = Fernet.generate_key()
+            envelope.append((
+                Fernet(data_key).encrypt(text.encode()).decode(),
+                master.encrypt(data_key).decode(),
+            ))
+
+        def direct_read(i):
+            master.decrypt(direct[i].encode())
+
+        def envelope_cold(i):
+            token, wrapped_key = envelope[i]
+            crypto.unwrap_key(master, wrapped_key).decrypt(token.encode())
+
+        cache = crypto.DataKeyCache(max_entries=patients)
+
+        def envelope_cached(i):
+            token, wrapped_key = envelope[i]
+            cache.get(master, wrapped_key).decrypt(token.encode())
+
+        self.stdout.write(f"{patients} patients, {reads} reads, {options['history_bytes']} byte histories")
+        self.stdout.write(f"{'scheme':<28}{'mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}")
+        for name, read in (
+            ("direct (master key)", direct_read),
+            ("envelope, no DEK cache", envelope_cold),
+            ("envelope, DEK cache", envelope_cached),
+        ):
+            samples = []
+            for n in range(reads):
+                i = n % patients
+                started = time.perf_counter()
+                read(i)
+                samples.append((time.perf_counter() - started) * 1e6)
+
+            samples.sort()
+            self.stdout.write(
+                f"{name:<28}{statistics.fmean(samples):>10.1f}"
+                f"{samples[len(samples) // 2]:>10.1f}{samples[int(len(samples) * 0.99)]:>10.1f}"
+            )
+
+        self.stdout.write(f"DEK cache: {cache.stats()}")
@@ -0,0 +1,207 @@
+import io
+import json
+import logging
+import re
+import time
+import warnings
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern
+
+from hospital import export, urls
+from hospital.consents import consent_index
+from hospital.models import Doctor, Patient, medical_history_cache
+
+PASSWORD = "benchmark"
+# Query strings for views that need one to do any work, by URL name
+QUERY_STRINGS = {
+    "available_slots": "doctor={doctor_id}",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database at several sizes and request every "
+        "URL in hospital/urls.py as an admin and as a doctor, recording query "
+        "counts, wall time and response size. Fails if any view's query count "
+        "grows with the data, and saves EXPLAIN plans of each view's slowest "
+        "queries at the largest size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="100,1000,5000",
+            help="Comma-separated patient counts to seed (default: 100,1000,5000).",
+        )
+        parser.add_argument("--top", type=int, default=3, help="Slowest queries per view to EXPLAIN (default: 3).")
+        parser.add_argument("--explain-dir", default="benchmark/explain", help="Where EXPLAIN plans are written.")
+        parser.add_argument("--output", default=None, help="Also write the results as JSON to this file.")
+        parser.add_argument("--keepdb", action="store_true", help="Reuse the test database if it exists.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options["sizes"].split(",")})
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        if not sizes or sizes[0] < 1:
+            raise CommandError("--sizes must be positive")
+
+        # Never touch the configured database: everything runs in the test database
+        setup_test_environment()
+        # Failing views are reported in the table, not logged one by one
+        request_logger = logging.getLogger("django.request")
+        old_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            results = [self.run_size(size, options, explain=size == sizes[-1]) for size in sizes]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+            request_logger.setLevel(old_level)
+
+        self.report(results)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+
+        growing = self.growing_views(results)
+        if growing:
+            raise CommandError("Query count grows with data size: " + ", ".join(growing))
+        self.stdout.write(self.style.SUCCESS("Query counts are constant across sizes."))
+
+    def run_size(self, size, options, explain=False):
+        call_command("flush", interactive=False, verbosity=0)
+        consent_index.invalidate()
+        medical_history_cache.clear()
+        cache.clear()
+
+        call_command(
+            "seed_synthetic_hospital",
+            doctors=max(2, size // 50),
+            patients=size,
+            appointments=size,
+            logs=size * 5,
+            seed=options["seed"],
+            verbosity=0,
+            stdout=self.stdout if options["verbosity"] > 1 else io.StringIO(),
+        )
+
+        User.objects.create_superuser("benchmark-admin", "", PASSWORD)
+        doctor_user = User.objects.create_user("benchmark-doctor", password=PASSWORD)
+        doctor = Doctor.objects.order_by("id").first()
+        doctor.user = doctor_user
+        doctor.save()
+        patient = Patient.objects.filter(consent__doctor=doctor, consent__granted=True).first() or Patient.objects.first()
+
+        clients = {}
+        for role, username in (("admin", "benchmark-admin"), ("doctor", "benchmark-doctor")):
+            # Broken views show up as a 500 in the report instead of aborting the run
+            clients[role] = Client(raise_request_exception=False)
+            clients[role].login(username=username, password=PASSWORD)
+
+        rows = {}
+        explain_dir = Path(options["explain_dir"])
+        for route, url in self.urls(doctor, patient):
+            for role, client in clients.items():
+                # Warm caches first, then measure the steady state
+                self.fetch(client, url)
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    status, length = self.fetch(client, url)
+                    elapsed = time.perf_counter() - started
+
+                label = f"/{route} [{role}]"
+                rows[label] = {
+                    "url": url,
+                    "status": status,
+                    "queries": len(ctx.captured_queries),
+                    "ms": round(elapsed * 1000, 1),
+                    "bytes": length,
+                }
+                if explain:
+                    self.save_explains(explain_dir, label, ctx.captured_queries, options["top"])
+
+        return {"size": size, "views": rows}
+
+    def urls(self, doctor, patient):
+        """``(route, url)`` for every URL of the app, with sample ids filled in."""
+        values = {"patient_id": patient.id, "doctor_id": doctor.id}
+        seen = set()
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            route = str(pattern.pattern)
+            if route in seen:
+                continue
+            seen.add(route)
+
+            query = QUERY_STRINGS.get(pattern.name, "").format(**values)
+            suffix = "?" + query if query else ""
+            if "<str:entity>" in route:
+                for entity in export.ENTITIES:
+                    entity_route = route.replace("<str:entity>", entity)
+                    yield entity_route, "/" + entity_route + suffix
+                continue
+            yield route, "/" + re.sub(r"<(?:\w+:)?(\w+)>", lambda m: str(values[m.group(1)]), route) + suffix
+
+    def fetch(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            # Iterating the response itself also drains async views' streams
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                length = sum(len(block) for block in response)
+        else:
+            length = len(response.content)
+        return response.status_code, length
+
+    def save_explains(self, directory, label, queries, top):
+        """Write EXPLAIN output of the ``top`` slowest SELECTs."""
+        selects = [q for q in queries if q["sql"].lstrip().upper().startswith("SELECT")]
+        selects.sort(key=lambda q: float(q["time"]), reverse=True)
+        if not selects:
+            return
+
+        explain = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        sections = []
+        for query in selects[:top]:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(explain + query["sql"])
+                    plan = "\n".join(" ".join(str(col) for col in row) for row in cursor.fetchall())
+            except Exception as exc:  # interpolated SQL is not always executable
+                plan = f"(could not explain: {exc})"
+            sections.append(f"-- {query['time']}s\n{query['sql']}\n\n{plan}\n")
+
+        directory.mkdir(parents=True, exist_ok=True)
+        filename = re.sub(r"[^\w.-]+", "_", label).strip("_") + ".txt"
+        if filename.startswith(("admin", "doctor")):
+            filename = "root_" + filename
+        (directory / filename).write_text("\n".join(sections))
+
+    def report(self, results):
+        sizes = [result["size"] for result in results]
+        header = f"{'view':<55}{'status':>7}" + "".join(f"{'q@' + str(s):>9}{'ms':>9}{'KB':>9}" for s in sizes)
+        self.stdout.write(header)
+        for label in results[0]["views"]:
+            line = f"{label:<55}{results[-1]['views'][label]['status']:>7}"
+            for result in results:
+                row = result["views"][label]
+                line += f"{row['queries']:>9}{row['ms']:>9.1f}{row['bytes'] / 1024:>9.1f}"
+            self.stdout.write(line)
+
+    def growing_views(self, results):
+        smallest, largest = results[0]["views"], results[-1]["views"]
+        return [
+            label for label, row in largest.items()
+            if row["queries"] > smallest[label]["queries"]
+        ]
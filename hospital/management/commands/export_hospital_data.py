@@ -0,0 +1,66 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from hospital import audit, export
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        "Export patients, consents, appointments or access logs as NDJSON, "
+        "streamed with constant memory and optionally gzipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("entity", choices=sorted(export.ENTITIES))
+        parser.add_argument("--output", "-o", default="-", help="Output file (default: stdout).")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument("--patient", type=int, default=None, help="Only rows for this patient id.")
+        parser.add_argument("--doctor", type=int, default=None, help="Only rows for this doctor id.")
+        parser.add_argument("--since", default=None, help="Only rows dated on or after this date/datetime.")
+        parser.add_argument("--until", default=None, help="Only rows dated before this date/datetime.")
+        parser.add_argument(
+            "--with-histories", action="store_true",
+            help="Include decrypted medical histories (patients only).",
+        )
+
+    def handle(self, *args, **options):
+        entity = options["entity"]
+        stream = export.export_stream(
+            entity,
+            compress=options["gzip"],
+            histories=options["with_histories"],
+            patient=options["patient"],
+            doctor=options["doctor"],
+            since=parse_moment(options["since"]) if options["since"] else None,
+            until=parse_moment(options["until"]) if options["until"] else None,
+        )
+
+        out = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for block in stream:
+                out.write(block)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+        action = f"Exported {entity}"
+        if options["with_histories"]:
+            action += " with medical histories"
+        audit.record(action=action)
+        audit.flush()
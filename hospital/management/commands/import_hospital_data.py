@@ -0,0 +1,264 @@
+import csv
+import io
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from hospital import audit, counters, crypto, dashboard, fragments
+from hospital.consents import consent_index
+from hospital.forms import ConsentForm, DoctorForm, PatientForm
+from hospital.graph import invalidate_cluster_summary
+from hospital.models import Consent, Doctor, EncryptionHelper, Patient
+
+DEFAULT_HISTORY = "No medical history yet."
+PATIENT_COLUMNS = ["name", "age", "address", "contact", "contact_index", "encrypted_medical_history", "wrapped_data_key"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import doctors, patients or consents from a CSV or NDJSON file. "
+        "Rows are validated with the same forms as the web views and written "
+        "in batches; consents are upserted on (doctor, patient), so re-running "
+        "an import does not duplicate them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["doctors", "patients", "consents"])
+        parser.add_argument("path", help="Input file, or - for stdin.")
+        parser.add_argument(
+            "--format", choices=["csv", "ndjson"], default=None,
+            help="Input format (default: from the file extension, csv for stdin).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Rows per insert / write transaction (default: 1000).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Worker processes for encrypting histories (default: CPU count, 0 = in-process).",
+        )
+        parser.add_argument(
+            "--copy", action="store_true",
+            help="Load doctors / patients with PostgreSQL COPY instead of INSERT.",
+        )
+        parser.add_argument(
+            "--max-errors", type=int, default=100,
+            help="Stop after this many invalid rows (default: 100). Batches already written are kept.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Validate the input without writing anything.",
+        )
+
+    def handle(self, *args, **options):
+        self.kind = options["kind"]
+        self.dry_run = options["dry_run"]
+        self.max_errors = options["max_errors"]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        self.use_copy = options["copy"]
+        if self.use_copy and self.kind == "consents":
+            raise CommandError("--copy cannot upsert, consents are always loaded with INSERT ... ON CONFLICT")
+        if self.use_copy and connection.vendor != "postgresql":
+            raise CommandError("--copy needs PostgreSQL")
+
+        workers = options["workers"]
+        if workers == 0:
+            self.pool = None
+        elif workers is None:
+            self.pool = crypto.get_pool()
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+
+        load = {
+            "doctors": self.load_doctors,
+            "patients": self.load_patients,
+            "consents": self.load_consents,
+        }[self.kind]
+
+        self.errors = 0
+        started = time.perf_counter()
+        read = written = 0
+        for batch in self.batches(self.read_rows(options["path"], options["format"]), batch_size):
+            read += len(batch)
+            written += load(batch)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{read} rows read, {written} {'valid' if self.dry_run else 'written'} ({read / elapsed:.0f} rows/s)")
+
+        if self.pool is not None and self.pool is not crypto.get_pool():
+            self.pool.shutdown()
+
+        if written and not self.dry_run:
+            # Bulk writes bypass the model signals
+            counters.reconcile()
+            if self.kind == "consents":
+                consent_index.invalidate()
+            invalidate_cluster_summary()
+            dashboard.invalidate()
+            fragments.bump(self.kind)
+            audit.record(action=f"Imported {written} {self.kind}")
+            audit.flush()
+
+        elapsed = time.perf_counter() - started
+        verb = "would be imported" if self.dry_run else "imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {read} rows read, {written} {self.kind} {verb}, {self.errors} invalid, "
+            f"in {elapsed:.1f}s ({read / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+
+    # Input
+
+    def read_rows(self, path, fmt):
+        """Yield ``(line number, dict)`` for each input row."""
+        if fmt is None:
+            fmt = "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        try:
+            if fmt == "csv":
+                reader = csv.DictReader(stream)
+                for row in reader:
+                    yield reader.line_num, row
+            else:
+                for line_num, line in enumerate(stream, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as exc:
+                        self.invalid(line_num, f"not valid JSON ({exc})")
+                        continue
+                    if not isinstance(row, dict):
+                        self.invalid(line_num, "expected a JSON object")
+                        continue
+                    yield line_num, row
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def batches(self, rows, size):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def invalid(self, line_num, message):
+        self.errors += 1
+        self.stderr.write(f"Line {line_num}: {message}")
+        if self.errors >= self.max_errors:
+            raise CommandError(f"Stopped after {self.errors} invalid rows")
+
+    def validated(self, form_class, batch):
+        """cleaned_data of the rows ``form_class`` accepts, reporting the others."""
+        valid = []
+        for line_num, row in batch:
+            form = form_class(data=row)
+            if form.is_valid():
+                valid.append((line_num, row, form.cleaned_data))
+            else:
+                errors = "; ".join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items())
+                self.invalid(line_num, errors)
+        return valid
+
+    # Loaders; each returns the number of rows written (or valid, in a dry run)
+
+    def load_doctors(self, batch):
+        doctors = [Doctor(**data) for _, _, data in self.validated(DoctorForm, batch)]
+        if self.dry_run or not doctors:
+            return len(doctors)
+
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy("hospital_doctor", ["name", "specialization"], [
+                    (d.name, d.specialization) for d in doctors
+                ])
+            else:
+                Doctor.objects.bulk_create(doctors)
+        return len(doctors)
+
+    def load_patients(self, batch):
+        valid = self.validated(PatientForm, batch)
+        if self.dry_run or not valid:
+            return len(valid)
+
+        histories = [row.get("medical_history") or DEFAULT_HISTORY for _, row, _ in valid]
+        # --workers 0 (no pool) encrypts in this process, whatever the batch size
+        encrypted = crypto.encrypt_many(EncryptionHelper.keys, histories, pool=self.pool, parallel=self.pool is not None)
+
+        patients = [
+            Patient(
+                **data,
+                contact_index=Patient.contact_blind_index(data["contact"]),
+                encrypted_medical_history=token,
+                wrapped_data_key=wrapped_key,
+            )
+            for (_, _, data), (token, wrapped_key) in zip(valid, encrypted)
+        ]
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy("hospital_patient", PATIENT_COLUMNS, [
+                    [getattr(p, column) for column in PATIENT_COLUMNS] for p in patients
+                ])
+            else:
+                Patient.objects.bulk_create(patients)
+        return len(patients)
+
+    def load_consents(self, batch):
+        granted_field = ConsentForm.base_fields["granted"]
+        pairs = {}
+        for line_num, row in batch:
+            try:
+                patient_id = int(row.get("patient"))
+                doctor_id = int(row.get("doctor"))
+                granted = granted_field.clean(row.get("granted"))
+            except (TypeError, ValueError):
+                self.invalid(line_num, "patient and doctor must be ids, granted a boolean")
+                continue
+            # The last row for a pair wins, as it would when posted one by one
+            pairs[doctor_id, patient_id] = (line_num, granted)
+
+        patients = set(Patient.objects.filter(id__in={p for _, p in pairs}).values_list("id", flat=True))
+        doctors = set(Doctor.objects.filter(id__in={d for d, _ in pairs}).values_list("id", flat=True))
+
+        consents = []
+        for (doctor_id, patient_id), (line_num, granted) in pairs.items():
+            if patient_id not in patients or doctor_id not in doctors:
+                self.invalid(line_num, f"unknown patient {patient_id} or doctor {doctor_id}")
+                continue
+            consents.append(Consent(doctor_id=doctor_id, patient_id=patient_id, granted=granted))
+
+        if self.dry_run or not consents:
+            return len(consents)
+
+        with transaction.atomic():
+            Consent.objects.bulk_create(
+                consents,
+                update_conflicts=True,
+                unique_fields=["doctor", "patient"],
+                update_fields=["granted", "updated_at"],
+            )
+        return len(consents)
+
+    def copy(self, table, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, "copy_expert"):
+                # psycopg2
+                cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
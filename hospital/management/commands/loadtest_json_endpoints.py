@@ -0,0 +1,250 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from hospital.models import Doctor
+
+# Endpoint -> (sync URL name, async URL name); the sync view is served by
+# the WSGI server, the async one by the ASGI server
+ENDPOINTS = {
+    "appointments": ("appointments_json", "appointments_json_async"),
+    "graph": ("doctor_patient_graph_data", "doctor_patient_graph_data_async"),
+    "graph_delta": ("doctor_patient_graph_data", "doctor_patient_graph_data_async"),
+    "clusters": ("doctor_patient_graph_clusters", "doctor_patient_graph_clusters_async"),
+    "cluster_patients": ("doctor_patient_graph_cluster_patients", "doctor_patient_graph_cluster_patients_async"),
+}
+QUERY_STRINGS = {
+    "graph_delta": "since=0",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the JSON read endpoints on a running WSGI server (sync "
+        "views) and a running ASGI server (async views) at several "
+        "concurrency levels, reporting throughput and p50/p99 latency. "
+        "Start both servers against the same database first, e.g. "
+        "gunicorn guardiandb.wsgi -w 4 -b 127.0.0.1:8000 and "
+        "uvicorn guardiandb.asgi:application --workers 4 --port 8001."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi", default="http://127.0.0.1:8000", help="Base URL of the WSGI server ('' to skip).")
+        parser.add_argument("--asgi", default="http://127.0.0.1:8001", help="Base URL of the ASGI server ('' to skip).")
+        parser.add_argument("--user", required=True, help="Username to send the requests as (a doctor, for appointments).")
+        parser.add_argument(
+            "--endpoints", default="appointments,clusters,cluster_patients,graph_delta",
+            help=f"Comma-separated endpoints from: {', '.join(ENDPOINTS)}.",
+        )
+        parser.add_argument(
+            "--concurrency", default="10,100,500",
+            help="Comma-separated numbers of concurrent connections (default: 10,100,500).",
+        )
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run (default: 10).")
+        parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each run (default: 2).")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds (default: 30).")
+        parser.add_argument("--output", default=None, help="Also write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        try:
+            levels = sorted({int(level) for level in options["concurrency"].split(",")})
+        except ValueError:
+            raise CommandError("--concurrency must be comma-separated integers")
+        if not levels or levels[0] < 1:
+            raise CommandError("--concurrency must be positive")
+
+        servers = [(mode, options[mode].rstrip("/")) for mode in ("wsgi", "asgi") if options[mode]]
+        if not servers:
+            raise CommandError("Nothing to test: both --wsgi and --asgi are empty")
+
+        try:
+            user = get_user_model().objects.get_by_natural_key(options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}")
+        doctor_id = (
+            Doctor.objects.filter(user=user).values_list("id", flat=True).first()
+            or Doctor.objects.values_list("id", flat=True).first()
+        )
+
+        session = self.login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+        results = []
+        try:
+            for endpoint in endpoints:
+                for mode, base in servers:
+                    url = base + self.path(endpoint, mode, doctor_id)
+                    for level in levels:
+                        result = asyncio.run(self.run(url, cookie, level, options))
+                        result.update(endpoint=endpoint, server=mode, concurrency=level)
+                        results.append(result)
+                        self.stdout.write(self.format_row(result))
+        finally:
+            session.delete()
+
+        self.report(results)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+
+    def login(self, user):
+        """A session both servers accept, since they share the database."""
+        session = SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    def path(self, endpoint, mode, doctor_id):
+        name = ENDPOINTS[endpoint][0 if mode == "wsgi" else 1]
+        kwargs = {"doctor_id": doctor_id or 0} if endpoint == "cluster_patients" else {}
+        path = reverse(name, kwargs=kwargs)
+        if endpoint in QUERY_STRINGS:
+            path += "?" + QUERY_STRINGS[endpoint]
+        return path
+
+    # Load generation
+
+    async def run(self, url, cookie, concurrency, options):
+        parts = urlsplit(url)
+        target = (parts.hostname, parts.port or 80, parts.netloc, parts.path + (f"?{parts.query}" if parts.query else ""))
+        if parts.scheme != "http":
+            raise CommandError(f"Only http:// servers are supported: {url}")
+
+        if options["warmup"] > 0:
+            await self.drive(target, cookie, min(concurrency, 10), options["warmup"], options["timeout"])
+        latencies, statuses, errors, elapsed = await self.drive(
+            target, cookie, concurrency, options["duration"], options["timeout"],
+        )
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "http_errors": sum(count for status, count in statuses.items() if status >= 400),
+            "rps": len(latencies) / elapsed if elapsed else 0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        }
+
+    async def drive(self, target, cookie, concurrency, duration, timeout):
+        latencies = []
+        statuses = {}
+        errors = 0
+        started = time.perf_counter()
+        deadline = started + duration
+
+        async def worker():
+            nonlocal errors
+            client = HTTPClient(target, cookie)
+            try:
+                while time.perf_counter() < deadline:
+                    sent = time.perf_counter()
+                    try:
+                        status = await asyncio.wait_for(client.get(), timeout)
+                    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                        errors += 1
+                        await client.close()
+                        continue
+                    latencies.append(time.perf_counter() - sent)
+                    statuses[status] = statuses.get(status, 0) + 1
+            finally:
+                await client.close()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, statuses, errors, time.perf_counter() - started
+
+    # Output
+
+    def format_row(self, r):
+        return (
+            f"{r['endpoint']:<18} {r['server']:<5} {r['concurrency']:>6} {r['requests']:>9} "
+            f"{r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f} "
+            f"{r['http_errors']:>7} {r['errors']:>6}"
+        )
+
+    def report(self, results):
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'endpoint':<18} {'srv':<5} {'conc':>6} {'requests':>9} {'req/s':>9} "
+            f"{'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'4xx/5xx':>7} {'errors':>6}"
+        )
+        for result in results:
+            self.stdout.write(self.format_row(result))
+        self.stdout.write(
+            "Latencies include time queued for a worker; the client itself "
+            "is one process, so check it is not the bottleneck at high concurrency."
+        )
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class HTTPClient:
+    """Minimal keep-alive HTTP/1.1 GET client, so the test has no extra dependencies."""
+
+    def __init__(self, target, cookie):
+        self.host, self.port, netloc, path = target
+        self.request = (
+            f"GET {path} HTTP/1.1\r\nHost: {netloc}\r\nCookie: {cookie}\r\n"
+            "Accept: application/json\r\nConnection: keep-alive\r\n\r\n"
+        ).encode()
+        self.reader = self.writer = None
+
+    async def get(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(self.request)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+            await self.close()
+            return status
+
+        if headers.get("connection") == "close":
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
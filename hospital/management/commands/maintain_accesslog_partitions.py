@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from hospital import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly AccessLog partitions, move rows out of the "
+        "default partition into their month's partition and, with --archive, "
+        "move partitions past the retention period into compressed NDJSON files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=3,
+            help="Number of months after the current one to create partitions for (default: 3).",
+        )
+        parser.add_argument(
+            "--archive", action="store_true",
+            help="Archive and drop partitions older than the retention period.",
+        )
+        parser.add_argument(
+            "--retention-months", type=int, default=None,
+            help="Months of access logs kept in the database (default: settings.ACCESS_LOG_RETENTION_MONTHS).",
+        )
+        parser.add_argument(
+            "--archive-dir", default=None,
+            help="Directory for archive files (default: settings.ACCESS_LOG_ARCHIVE_DIR).",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report what would be created or archived.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            existing = partitions.list_partitions()
+        except partitions.PartitioningNotSupported as exc:
+            raise CommandError(str(exc))
+
+        if not partitions.is_partitioned():
+            raise CommandError("hospital_accesslog is not partitioned, run migrate first.")
+
+        # Rows that arrived while their month had no partition
+        for year, month in partitions.default_months():
+            verb = "Would move" if options["dry_run"] else "Moving"
+            self.stdout.write(self.style.WARNING(
+                f"{verb} rows of {year:04d}-{month:02d} from the default partition to {partitions.partition_name(year, month)}"
+            ))
+
+        if options["dry_run"]:
+            self.stdout.write(f"Existing partitions: {len(existing)}")
+        else:
+            try:
+                created = partitions.ensure_partitions(options["ahead"])
+            except DatabaseError as exc:
+                raise CommandError(f"Could not create partitions: {exc}")
+            for name in created:
+                self.stdout.write(self.style.SUCCESS(f"Created {name}"))
+            if not created:
+                self.stdout.write("All upcoming partitions already exist.")
+
+        if not options["archive"]:
+            return
+
+        expired = partitions.expired_partitions(options["retention_months"])
+        if not expired:
+            self.stdout.write("No partitions past the retention period.")
+            return
+
+        for year, month in expired:
+            name = partitions.partition_name(year, month)
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {name}")
+                continue
+
+            path, rows = partitions.archive_partition(year, month, options["archive_dir"])
+            self.stdout.write(self.style.SUCCESS(f"Archived {name}: {rows} rows -> {path}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from hospital import graph
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete consent tombstones and graph node changes older than the "
+        "graph sync window (GRAPH_SYNC_WINDOW_DAYS); clients further behind "
+        "reload the whole graph anyway. Run it regularly, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report how many rows would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        count = graph.purge_tombstones(dry_run=options["dry_run"])
+        verb = "would be deleted" if options["dry_run"] else "deleted"
+        self.stdout.write(self.style.SUCCESS(f"{count} expired consent tombstones and node changes {verb}"))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hospital import counters, dashboard, fragments
+from hospital.graph import invalidate_cluster_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-doctor and per-specialization patient counters "
+        "from the consents and repair any that drifted (e.g. after bulk "
+        "writes that bypass the model signals)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report drifted counters without fixing them.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fixes = counters.reconcile(dry_run=options["dry_run"])
+
+        for kind, key, stored, actual in fixes:
+            self.stdout.write(f"{kind} {key}: stored {stored}, actual {actual}")
+
+        if fixes and not options["dry_run"]:
+            invalidate_cluster_summary()
+            dashboard.invalidate()
+            # The dashboard's chart data shows the counts
+            fragments.bump("consents")
+
+        elapsed = time.perf_counter() - started
+        verb = "drifted" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(fixes)} counters {verb} in {elapsed:.1f}s"))
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from hospital import crypto
+from hospital.models import EncryptionHelper, Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrap every patient's data key with the newest key in "
+        "MEDICAL_HISTORY_KEYS, moving histories without a data key to "
+        "envelope encryption. Runs online in small primary-key chunks and "
+        "can be resumed from its checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="Patients per chunk / write transaction (default: 1000).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Worker processes for re-encryption (default: CPU count, 0 = in-process).",
+        )
+        parser.add_argument(
+            "--checkpoint", default=None,
+            help="Checkpoint file (default: BASE_DIR/.medical_history_rotation.json).",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore an existing checkpoint and start from the first patient.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        checkpoint_path = Path(options["checkpoint"] or settings.BASE_DIR / ".medical_history_rotation.json")
+        fingerprint = hashlib.sha256(EncryptionHelper.key).hexdigest()[:16]
+        last_pk = 0 if options["restart"] else self.load_checkpoint(checkpoint_path, fingerprint)
+        if last_pk:
+            self.stdout.write(f"Resuming after patient {last_pk}")
+
+        workers = options["workers"]
+        if workers == 0:
+            pool = None
+        elif workers is None:
+            workers = os.cpu_count() or 1
+            pool = crypto.get_pool()
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        # Keep a couple of chunks per worker queued, never the whole table
+        max_in_flight = 2 * max(workers, 1)
+
+        rows = (
+            Patient.objects
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "encrypted_medical_history", "wrapped_data_key")
+            .iterator(chunk_size=chunk_size)
+        )
+
+        started = time.perf_counter()
+        scanned = rotated = skipped = 0
+        pending = deque()  # (last pk of chunk, chunk size, future or result)
+
+        def drain(block_until):
+            nonlocal scanned, rotated, skipped
+            while len(pending) > block_until:
+                chunk_last_pk, size, job = pending.popleft()
+                results = job.result() if pool else job
+                written = self.write_chunk(results)
+
+                scanned += size
+                rotated += written
+                skipped += len(results) - written
+                self.save_checkpoint(checkpoint_path, fingerprint, chunk_last_pk)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"Up to patient {chunk_last_pk}: {scanned} scanned, {rotated} rotated "
+                    f"({scanned / elapsed:.0f} rows/s)"
+                )
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                pending.append(self.submit(pool, chunk))
+                chunk = []
+                drain(max_in_flight)
+        if chunk:
+            pending.append(self.submit(pool, chunk))
+        drain(0)
+
+        if pool is not None and pool is not crypto.get_pool():
+            pool.shutdown()
+
+        elapsed = time.perf_counter() - started
+        checkpoint_path.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {scanned} patients scanned, {rotated} re-encrypted, "
+            f"{skipped} changed concurrently and left as is, in {elapsed:.1f}s "
+            f"({scanned / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+
+    def submit(self, pool, chunk):
+        if pool is None:
+            return chunk[-1][0], len(chunk), crypto.rotate_chunk(EncryptionHelper.keys, chunk)
+        return chunk[-1][0], len(chunk), pool.submit(crypto.rotate_chunk, EncryptionHelper.keys, chunk)
+
+    def write_chunk(self, results):
+        """
+        Write rewrapped keys / re-encrypted histories in one short transaction.
+
+        Rows changed since they were read (e.g. a doctor updated the
+        history meanwhile, which already used the new key) are skipped.
+        """
+        if not results:
+            return 0
+
+        with transaction.atomic():
+            current = {
+                pk: (token, wrapped_key)
+                for pk, token, wrapped_key in Patient.objects
+                .select_for_update()
+                .filter(pk__in=[row[0] for row in results])
+                .values_list("pk", "encrypted_medical_history", "wrapped_data_key")
+            }
+            changed = [
+                Patient(pk=pk, encrypted_medical_history=new_token, wrapped_data_key=new_wrapped_key)
+                for pk, old_token, old_wrapped_key, new_token, new_wrapped_key in results
+                if current.get(pk) == (old_token, old_wrapped_key)
+            ]
+            Patient.objects.bulk_update(changed, ["encrypted_medical_history", "wrapped_data_key"])
+        return len(changed)
+
+    def load_checkpoint(self, path, fingerprint):
+        if not path.exists():
+            return 0
+        state = json.loads(path.read_text())
+        if state.get("key") != fingerprint:
+            self.stdout.write("Checkpoint belongs to a different primary key, starting over.")
+            return 0
+        return state.get("last_pk", 0)
+
+    def save_checkpoint(self, path, fingerprint, last_pk):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"key": fingerprint, "last_pk": last_pk}))
+        tmp.replace(path)
@@ -0,0 +1,182 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from hospital import counters, crypto, dashboard, fragments
+from hospital.consents import consent_index
+from hospital.graph import invalidate_cluster_summary
+from hospital.models import AccessLog, Appointment, Consent, Doctor, EncryptionHelper, Patient
+
+SPECIALIZATIONS = [
+    "Cardiology", "Neurology", "Oncology", "Pediatrics", "Orthopedics",
+    "Dermatology", "Psychiatry", "Radiology", "General Medicine", "ENT",
+]
+FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Ananya", "Vivaan", "Saanvi", "Kabir", "Meera", "Arjun", "Riya", "Rohan", "Priya"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Reddy", "Nair", "Gupta", "Singh", "Das", "Menon", "Joshi", "Khan", "Rao"]
+ACTIONS = ["Viewed patient record", "Updated medical history", "Created Appointment", "Granted consent", "Revoked consent"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Add synthetic doctors, patients, consents, appointments and access-log "
+        "rows for development and benchmarking. Never run this against production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=50)
+        parser.add_argument("--patients", type=int, default=2000)
+        parser.add_argument(
+            "--consents-per-patient", type=int, default=2,
+            help="Doctors each patient has a consent row for (default: 2).",
+        )
+        parser.add_argument(
+            "--granted-ratio", type=float, default=0.8,
+            help="Share of consents that are granted (default: 0.8).",
+        )
+        parser.add_argument("--appointments", type=int, default=2000)
+        parser.add_argument("--logs", type=int, default=10000, help="Access-log rows (default: 10000).")
+        parser.add_argument("--days", type=int, default=90, help="Spread dates over this many days around today (default: 90).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, for reproducible data.")
+
+    def handle(self, *args, **options):
+        if options["doctors"] < 1 and (options["patients"] or options["appointments"] or options["logs"]):
+            raise CommandError("--doctors must be at least 1")
+
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.days = max(options["days"], 1)
+        started = time.perf_counter()
+
+        doctor_ids = self.create_doctors(options["doctors"])
+        patient_ids = self.create_patients(options["patients"])
+        consents = self.create_consents(
+            doctor_ids, patient_ids,
+            min(options["consents_per_patient"], len(doctor_ids)),
+            options["granted_ratio"],
+        )
+        appointments = self.create_appointments(doctor_ids, patient_ids, options["appointments"])
+        logs = self.create_logs(doctor_ids, patient_ids, options["logs"])
+
+        # Bulk inserts bypass the model signals
+        counters.reconcile()
+        consent_index.invalidate()
+        invalidate_cluster_summary()
+        dashboard.invalidate()
+        fragments.bump(*fragments.DOMAINS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(doctor_ids)} doctors, {len(patient_ids)} patients, {consents} consents, "
+            f"{appointments} appointments and {logs} access-log rows in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def name(self):
+        return f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+
+    def moment(self):
+        offset = self.random.uniform(-self.days / 2, self.days / 2)
+        return timezone.now() + datetime.timedelta(days=offset)
+
+    def insert(self, model, objects, **kwargs):
+        with transaction.atomic():
+            return model.objects.bulk_create(objects, batch_size=self.batch_size, **kwargs)
+
+    def create_doctors(self, count):
+        doctors = [
+            Doctor(name=f"Dr. {self.name()}", specialization=self.random.choice(SPECIALIZATIONS))
+            for _ in range(count)
+        ]
+        return [doctor.pk for doctor in self.insert(Doctor, doctors)]
+
+    def create_patients(self, count):
+        ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            histories = [
+                f"Synthetic history: {self.random.choice(SPECIALIZATIONS).lower()} follow-up."
+                for _ in range(size)
+            ]
+            encrypted = crypto.encrypt_many(EncryptionHelper.keys, histories)
+            patients = []
+            for token, wrapped_key in encrypted:
+                contact = f"9{self.random.randint(0, 999999999):09d}"
+                patients.append(Patient(
+                    name=self.name(),
+                    age=self.random.randint(1, 95),
+                    address=f"{self.random.randint(1, 999)} Synthetic Street",
+                    contact=contact,
+                    contact_index=Patient.contact_blind_index(contact),
+                    encrypted_medical_history=token,
+                    wrapped_data_key=wrapped_key,
+                ))
+            ids.extend(patient.pk for patient in self.insert(Patient, patients))
+        return ids
+
+    def create_consents(self, doctor_ids, patient_ids, per_patient, granted_ratio):
+        created = 0
+        batch = []
+        for patient_id in patient_ids:
+            for doctor_id in self.random.sample(doctor_ids, per_patient):
+                batch.append(Consent(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    granted=self.random.random() < granted_ratio,
+                ))
+            if len(batch) >= self.batch_size:
+                created += len(self.insert(Consent, batch))
+                batch = []
+        if batch:
+            created += len(self.insert(Consent, batch))
+        return created
+
+    def create_appointments(self, doctor_ids, patient_ids, count):
+        if not patient_ids:
+            return 0
+
+        # Back-to-back half hour slots per doctor, so none overlap
+        next_slot = {}
+        start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) - datetime.timedelta(days=self.days // 2)
+        length = datetime.timedelta(minutes=30)
+
+        created = 0
+        batch = []
+        for _ in range(count):
+            doctor_id = self.random.choice(doctor_ids)
+            starts_at = next_slot.get(doctor_id, start)
+            next_slot[doctor_id] = starts_at + length * self.random.randint(1, 4)
+            batch.append(Appointment(
+                doctor_id=doctor_id,
+                patient_id=self.random.choice(patient_ids),
+                appointment_date=starts_at,
+                duration_minutes=30,
+                ends_at=starts_at + length,
+                notes="Synthetic appointment",
+            ))
+            if len(batch) >= self.batch_size:
+                created += len(self.insert(Appointment, batch))
+                batch = []
+        if batch:
+            created += len(self.insert(Appointment, batch))
+        return created
+
+    def create_logs(self, doctor_ids, patient_ids, count):
+        if not patient_ids:
+            return 0
+
+        created = 0
+        for start in range(0, count, self.batch_size):
+            logs = [
+                AccessLog(
+                    doctor_id=self.random.choice(doctor_ids),
+                    patient_id=self.random.choice(patient_ids),
+                    action=self.random.choice(ACTIONS),
+                    timestamp=self.moment(),
+                )
+                for _ in range(min(self.batch_size, count - start))
+            ]
+            created += len(self.insert(AccessLog, logs))
+        return created
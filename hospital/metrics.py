@@ -0,0 +1,363 @@
+"""
+Per-request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records, per URL name: request latency, SQL query
+count and SQL time (through ``connection.execute_wrapper``), response
+size and the number of audit-log entries recorded. ``render()`` produces
+the text served by the superuser-only metrics view.
+
+Database connections are counted as they are opened (``connection_created``,
+see signals.py): checkouts, new physical connections, and new connections
+per view, which stay near zero once connections are reused. With the
+psycopg 3 pool (``DB_POOL``) the pool's own statistics are exported too:
+wait time, queued and timed-out requests, connection setup time.
+
+Cached template fragments (see fragments.py) count their hits and misses
+per fragment name.
+
+Metrics live in process memory, so with several worker processes each
+one reports its own numbers.
+
+Under ASGI the ORM runs on a per-request thread (async views reach it
+through ``sync_to_async``), so the middleware installs its query wrapper
+on that thread's connections rather than on the event loop's.
+
+Configured through ``settings.METRICS``:
+
+    METRICS = {
+        "ENABLED": True,
+        "SLOW_REQUEST_SECONDS": None,  # log requests slower than this, with their SQL
+        "SLOW_REQUEST_MAX_QUERIES": 100,  # SQL statements kept per logged request
+    }
+"""
+
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+slow_logger = logging.getLogger("hospital.slow_requests")
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SLOW_REQUEST_SECONDS": None,
+    "SLOW_REQUEST_MAX_QUERIES": 100,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def conf():
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    lines.append(f"{self.name}_bucket{_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(labels + (('le', '+Inf'),))} {state[-1]}")
+                lines.append(f"{self.name}_sum{_labels(labels)} {state[-2]}")
+                lines.append(f"{self.name}_count{_labels(labels)} {state[-1]}")
+        return lines
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+requests_total = Counter("hospital_http_requests_total", "Requests by view, method and status.")
+request_seconds = Histogram("hospital_http_request_duration_seconds", "Request latency by view.", LATENCY_BUCKETS)
+request_queries = Histogram("hospital_http_request_queries", "SQL queries per request by view.", QUERY_BUCKETS)
+request_sql_seconds = Histogram("hospital_http_request_sql_seconds", "Total SQL time per request by view.", LATENCY_BUCKETS)
+response_bytes = Histogram("hospital_http_response_bytes", "Response body size by view.", SIZE_BUCKETS)
+audit_entries = Counter("hospital_http_request_audit_entries_total", "Audit-log entries recorded by view.")
+
+request_db_connects = Counter("hospital_http_request_db_connects_total", "New database connections opened while serving each view.")
+db_checkouts = Counter("hospital_db_connection_checkouts_total", "Connections handed to Django (new, or taken from the pool) by alias.")
+db_connects = Counter("hospital_db_connections_opened_total", "New physical database connections by alias.")
+fragment_cache_hits = Counter("hospital_fragment_cache_hits_total", "Template fragments served from the cache (see fragments.py).")
+fragment_cache_misses = Counter("hospital_fragment_cache_misses_total", "Template fragments rendered and cached.")
+
+REQUEST_METRICS = (
+    requests_total, request_seconds, request_queries, request_sql_seconds, response_bytes, audit_entries,
+    request_db_connects, db_checkouts, db_connects, fragment_cache_hits, fragment_cache_misses,
+)
+
+
+class RequestState:
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.audit_entries = 0
+        self.db_connects = 0
+        self.keep_sql = keep_sql
+        self.statements = []  # (sql, seconds), only for the slow-request log
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if len(self.statements) < self.keep_sql:
+                self.statements.append((sql, elapsed))
+
+
+_current = contextvars.ContextVar("hospital_request_metrics", default=None)
+
+
+def note_audit_entry():
+    """Count an audit-log entry against the current request, if any."""
+    state = _current.get()
+    if state is not None:
+        state.audit_entries += 1
+
+
+# Driver connections already seen; pool checkouts hand the same ones out again
+_known_connections = weakref.WeakSet()
+_known_lock = threading.Lock()
+
+
+def note_db_connection(connection):
+    """Count a connection handed to ``connection`` (a Django DatabaseWrapper)."""
+    labels = (("alias", connection.alias),)
+    db_checkouts.inc(labels)
+
+    raw = connection.connection
+    with _known_lock:
+        try:
+            if raw in _known_connections:
+                return
+            _known_connections.add(raw)
+        except TypeError:
+            # Driver connections that cannot be weakly referenced are never pooled
+            pass
+
+    db_connects.inc(labels)
+    state = _current.get()
+    if state is not None:
+        state.db_connects += 1
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        options = conf()
+        self.enabled = options["ENABLED"]
+        self.slow_seconds = options["SLOW_REQUEST_SECONDS"]
+        self.keep_sql = options["SLOW_REQUEST_MAX_QUERIES"] if self.slow_seconds is not None else 0
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        state = RequestState(self.keep_sql)
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            with self.instrument(state):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        self.measure(request, response, state, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        state = RequestState(self.keep_sql)
+        token = _current.set(state)
+        started = time.perf_counter()
+        try:
+            stack = await sync_to_async(self.instrument)(state)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+
+        self.measure(request, response, state, started)
+        return response
+
+    def measure(self, request, response, state, started):
+        if not response.streaming:
+            self.finish(request, response, state, started, len(response.content))
+            return
+        # The body (and its queries) is produced after we return; async
+        # views may stream asynchronously under either handler
+        content = response.streaming_content
+        measure_stream = self.ameasure_stream if response.is_async else self.measure_stream
+        response.streaming_content = measure_stream(request, response, content, state, started)
+
+    def instrument(self, state):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(state))
+        return stack
+
+    def measure_stream(self, request, response, content, state, started):
+        size = 0
+        try:
+            with self.instrument(state):
+                for block in content:
+                    size += len(block)
+                    yield block
+        finally:
+            self.finish(request, response, state, started, size)
+
+    async def ameasure_stream(self, request, response, content, state, started):
+        size = 0
+        stack = await sync_to_async(self.instrument)(state)
+        try:
+            async for block in content:
+                size += len(block)
+                yield block
+        finally:
+            await sync_to_async(stack.close)()
+            self.finish(request, response, state, started, size)
+
+    def finish(self, request, response, state, started, size):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        labels = (("view", view),)
+
+        requests_total.inc(labels + (("method", request.method), ("status", response.status_code)))
+        request_seconds.observe(labels, elapsed)
+        request_queries.observe(labels, state.queries)
+        request_sql_seconds.observe(labels, state.sql_seconds)
+        response_bytes.observe(labels, size)
+        if state.audit_entries:
+            audit_entries.inc(labels, state.audit_entries)
+        if state.db_connects:
+            request_db_connects.inc(labels, state.db_connects)
+
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            statements = "\n".join(f"  {seconds * 1000:.1f}ms  {sql}" for sql, seconds in state.statements)
+            slow_logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs\n%s",
+                request.method, request.get_full_path(), view, elapsed,
+                state.queries, state.sql_seconds, statements,
+            )
+
+
+def _gauges(prefix, stats):
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value}")
+    return lines
+
+
+def pool_stats():
+    """``{alias: stats}`` of the psycopg 3 connection pools in use (see DB_POOL)."""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    from . import audit
+    from .consents import consent_index
+    from .models import EncryptionHelper, medical_history_cache
+    from .routers import replica_lags
+
+    lines = []
+    for metric in REQUEST_METRICS:
+        lines.extend(metric.render())
+
+    lines.extend(_gauges("hospital_audit_writer", audit.writer.stats()))
+    lines.extend(_gauges("hospital_consent_index", consent_index.stats()))
+    lines.extend(_gauges("hospital_data_key_cache", EncryptionHelper.data_keys.stats()))
+    lines.extend(_gauges("hospital_medical_history_cache", medical_history_cache.stats()))
+
+    lags = replica_lags()
+    if lags:
+        lines.append("# TYPE hospital_db_replica_lag_seconds gauge")
+        for alias, lag in sorted(lags.items()):
+            # -1: unreachable at the last check
+            lines.append(f"hospital_db_replica_lag_seconds{_labels((('alias', alias),))} {-1 if lag is None else lag}")
+
+    # requests_wait_ms: time spent waiting for a free connection;
+    # requests_queued / requests_errors: checkouts that found the pool
+    # exhausted / gave up after DB_POOL_TIMEOUT
+    pools = pool_stats()
+    for key in sorted({key for stats in pools.values() for key in stats}):
+        lines.append(f"# TYPE hospital_db_pool_{key} gauge")
+        for alias, stats in sorted(pools.items()):
+            if key in stats:
+                lines.append(f"hospital_db_pool_{key}{_labels((('alias', alias),))} {stats[key]}")
+    return "\n".join(lines) + "\n"
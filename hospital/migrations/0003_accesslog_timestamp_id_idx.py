@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 18:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0002_alter_accesslog_doctor_alter_accesslog_patient'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['-timestamp', '-id'], name='accesslog_timestamp_id_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+import datetime
+
+from django.db import migrations
+
+from hospital import partitions
+
+TABLE = partitions.TABLE
+LEGACY = f"{TABLE}_legacy"
+
+
+def partition_accesslog(apps, schema_editor):
+    """
+    Rebuild hospital_accesslog as a table range-partitioned by month on
+    timestamp. Only runs on PostgreSQL; other backends keep a plain table.
+    """
+    conn = schema_editor.connection
+    if conn.vendor != "postgresql" or partitions.is_partitioned(conn):
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+        cursor.execute('DROP INDEX IF EXISTS "accesslog_timestamp_id_idx"')
+
+        # The partition key has to be part of the primary key
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY ("id", "timestamp")')
+        cursor.execute(f'CREATE INDEX "accesslog_timestamp_id_idx" ON "{TABLE}" ("timestamp" DESC, "id" DESC)')
+        for column, target in (("user_id", "auth_user"), ("doctor_id", "hospital_doctor"), ("patient_id", "hospital_patient")):
+            cursor.execute(f'CREATE INDEX "{TABLE}_{column}_idx" ON "{TABLE}" ("{column}")')
+            cursor.execute(
+                f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_{column}_fk" '
+                f'FOREIGN KEY ("{column}") REFERENCES "{target}" ("id") DEFERRABLE INITIALLY DEFERRED'
+            )
+
+        cursor.execute(f'CREATE TABLE "{partitions.DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+        # One partition per month that already has rows, plus the months ahead
+        cursor.execute(
+            f'SELECT DISTINCT date_trunc(\'month\', "timestamp" AT TIME ZONE \'UTC\') FROM "{LEGACY}"'
+        )
+        months = {(row[0].year, row[0].month) for row in cursor.fetchall()}
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    for offset in range(4):
+        months.add(partitions.add_months(today.year, today.month, offset))
+    for year, month in sorted(months):
+        partitions.create_partition(year, month, conn)
+
+    with conn.cursor() as cursor:
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{LEGACY}"')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{TABLE}\"', 'id'), "
+            f'COALESCE((SELECT MAX("id") FROM "{TABLE}"), 0) + 1, false)'
+        )
+        cursor.execute(f'DROP TABLE "{LEGACY}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0004_alter_accesslog_timestamp'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_accesslog, elidable=False),
+    ]
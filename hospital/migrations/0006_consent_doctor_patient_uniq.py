@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+def remove_duplicate_consents(apps, schema_editor):
+    """Keep only the most recently updated consent for each (doctor, patient)."""
+    Consent = apps.get_model('hospital', 'Consent')
+
+    seen = set()
+    duplicates = []
+    rows = Consent.objects.order_by('doctor_id', 'patient_id', '-updated_at', '-id').values_list('id', 'doctor_id', 'patient_id')
+    for consent_id, doctor_id, patient_id in rows.iterator():
+        if (doctor_id, patient_id) in seen:
+            duplicates.append(consent_id)
+        else:
+            seen.add((doctor_id, patient_id))
+
+    Consent.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0005_partition_accesslog'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_consents, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='consent',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='consent_doctor_patient_uniq'),
+        ),
+    ]
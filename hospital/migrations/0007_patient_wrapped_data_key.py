@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0006_consent_doctor_patient_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='wrapped_data_key',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
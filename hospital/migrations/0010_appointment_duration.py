@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-18 20:52
+
+import datetime
+
+from django.db import migrations, models
+
+
+def fill_ends_at(apps, schema_editor):
+    """
+    Give existing appointments the default 30 minute duration. Where that
+    would overlap the doctor's next appointment, the earlier one is
+    shortened to end when the next begins, so the overlap constraint can
+    be added.
+    """
+    Appointment = apps.get_model('hospital', 'Appointment')
+
+    previous = None
+    batch = []
+    rows = Appointment.objects.order_by('doctor_id', 'appointment_date', 'id').only('id', 'doctor_id', 'appointment_date')
+    for appointment in rows.iterator(chunk_size=2000):
+        appointment.duration_minutes = 30
+        appointment.ends_at = appointment.appointment_date + datetime.timedelta(minutes=30)
+
+        if previous is not None and previous.doctor_id == appointment.doctor_id and previous.ends_at > appointment.appointment_date:
+            previous.ends_at = appointment.appointment_date
+            previous.duration_minutes = int((previous.ends_at - previous.appointment_date).total_seconds() // 60)
+
+        if previous is not None:
+            batch.append(previous)
+        previous = appointment
+
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ['duration_minutes', 'ends_at'])
+            batch = []
+
+    if previous is not None:
+        batch.append(previous)
+    Appointment.objects.bulk_update(batch, ['duration_minutes', 'ends_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0009_appointment_calendar_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=30),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_ends_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+def add_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE hospital_appointment ADD CONSTRAINT appointment_no_overlap '
+        'EXCLUDE USING gist (doctor_id WITH =, tstzrange(appointment_date, ends_at) WITH &&)'
+    )
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE hospital_appointment DROP CONSTRAINT IF EXISTS appointment_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_appointment_duration'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RunPython(add_overlap_constraint, drop_overlap_constraint),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 21:40
+
+from django.db import migrations
+
+INDEXES = [
+    ('patient_name_trgm_idx', 'hospital_patient', 'gin (name gin_trgm_ops)'),
+    ('patient_contact_trgm_idx', 'hospital_patient', 'gin (contact gin_trgm_ops)'),
+    ('patient_name_fts_idx', 'hospital_patient', "gin (to_tsvector('simple'::regconfig, COALESCE(name, '')))"),
+    ('doctor_name_trgm_idx', 'hospital_doctor', 'gin (name gin_trgm_ops)'),
+    ('doctor_specialization_trgm_idx', 'hospital_doctor', 'gin (specialization gin_trgm_ops)'),
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, definition in INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING {definition}')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0011_appointment_no_overlap'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-18 23:10
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_counters(apps, schema_editor):
+    Doctor = apps.get_model('hospital', 'Doctor')
+    Consent = apps.get_model('hospital', 'Consent')
+    SpecializationCount = apps.get_model('hospital', 'SpecializationCount')
+
+    doctors = list(Doctor.objects.annotate(n=Count('consent', filter=Q(consent__granted=True))).only('id'))
+    for doctor in doctors:
+        doctor.patient_count = doctor.n
+    Doctor.objects.bulk_update(doctors, ['patient_count'], batch_size=1000)
+
+    per_specialization = (
+        Consent.objects
+        .filter(granted=True)
+        .values_list('doctor__specialization')
+        .annotate(n=Count('patient_id', distinct=True))
+        .order_by()
+    )
+    SpecializationCount.objects.bulk_create([
+        SpecializationCount(specialization=specialization, patient_count=n)
+        for specialization, n in per_specialization
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0013_patient_contact_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='patient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SpecializationCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(max_length=100, unique=True)),
+                ('patient_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
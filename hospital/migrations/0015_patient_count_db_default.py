@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0014_patient_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='patient_count',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+    ]
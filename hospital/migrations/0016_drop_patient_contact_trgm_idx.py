@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 10:05
+
+from django.db import migrations
+
+# Contacts are only matched exactly, through Patient.contact_index, so the
+# trigram index from 0012 is never read
+
+
+def drop_contact_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS patient_contact_trgm_idx')
+
+
+def create_contact_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS patient_contact_trgm_idx ON hospital_patient USING gin (contact gin_trgm_ops)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0015_patient_count_db_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_contact_trgm_index, create_contact_trgm_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 10:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0016_drop_patient_contact_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GraphNodeChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('node_id', models.BigIntegerField()),
+                ('changed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 10:50
+
+import hospital.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0017_graph_node_change'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctor',
+            name='patient_count',
+            field=hospital.models.CounterField(db_default=0, default=0, editable=False),
+        ),
+    ]
@@ -1,64 +1,239 @@
-from django.db import models
+import datetime
+import itertools
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 from cryptography.fernet import Fernet
+
+from . import crypto
 from django.contrib.auth.models import User
 
 # Step 1: Encryption helper
 class EncryptionHelper:
-    # FIXED key — generate once and reuse
-    # Example: Fernet.generate_key() -> store this in a variable or .env
-    key = b'go2vz-2S-EklURltX8XkusMLnegRlCTBBbXg8_bhrJk='
-    fernet = Fernet(key)
+    # Master keys from settings.MEDICAL_HISTORY_KEYS, newest first.
+    # Each patient's history is encrypted with its own data key, which is
+    # stored wrapped (encrypted) by the master keys in Patient.wrapped_data_key.
+    # New data keys are wrapped with the first master key; older keys only unwrap.
+    # Example: Fernet.generate_key() -> prepend it to MEDICAL_HISTORY_KEYS
+    keys = [k.encode() if isinstance(k, str) else k for k in settings.MEDICAL_HISTORY_KEYS]
+    key = keys[0]
+    fernet = crypto.multi_fernet(keys)
+    data_keys = crypto.DataKeyCache(getattr(settings, 'DATA_KEY_CACHE_SIZE', 10000))
+
+    @staticmethod
+    def new_data_key():
+        """A fresh data key, wrapped with the primary master key."""
+        return EncryptionHelper.fernet.encrypt(Fernet.generate_key()).decode()
+
+    @staticmethod
+    def _fernet_for(wrapped_key):
+        if not wrapped_key:
+            # Histories written before envelope encryption use the master key directly
+            return EncryptionHelper.fernet
+        return EncryptionHelper.data_keys.get(EncryptionHelper.fernet, wrapped_key)
 
     @staticmethod
-    def encrypt(data):
-        return EncryptionHelper.fernet.encrypt(data.encode()).decode()
+    def encrypt(data, wrapped_key=None):
+        return EncryptionHelper._fernet_for(wrapped_key).encrypt(data.encode()).decode()
 
     @staticmethod
-    def decrypt(data):
-        return EncryptionHelper.fernet.decrypt(data.encode()).decode()
+    def decrypt(data, wrapped_key=None):
+        return EncryptionHelper._fernet_for(wrapped_key).decrypt(data.encode()).decode()
+
+    @staticmethod
+    def decrypt_many(tokens, wrapped_keys=None):
+        # Large batches are spread over a process pool
+        if wrapped_keys is None:
+            wrapped_keys = itertools.repeat('')
+        return crypto.decrypt_many(EncryptionHelper.keys, zip(tokens, wrapped_keys))
+
+    @staticmethod
+    def rotate(data):
+        """Re-encrypt a token (e.g. a wrapped data key) with the current primary key."""
+        return EncryptionHelper.fernet.rotate(data.encode()).decode()
+
+
+# Optional cache of decrypted histories, see settings.MEDICAL_HISTORY_CACHE
+_cache_conf = getattr(settings, 'MEDICAL_HISTORY_CACHE', {})
+medical_history_cache = crypto.PlaintextCache(
+    enabled=_cache_conf.get('ENABLED', False),
+    max_entries=_cache_conf.get('MAX_ENTRIES', 1000),
+    max_bytes=_cache_conf.get('MAX_BYTES', 4 * 1024 * 1024),
+    ttl=_cache_conf.get('TTL', 60),
+)
 
 from django.contrib.auth.models import User
 
+class PatientManager(models.Manager):
+    def by_contact(self, contact):
+        """Patients with exactly this contact (after normalisation), found through the blind index."""
+        return self.filter(contact_index=Patient.contact_blind_index(contact))
+
+
 class Patient(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
     age = models.IntegerField()
     address = models.CharField(max_length=255, null=True, blank=True)
     contact = models.CharField(max_length=15)
+    # Keyed HMAC of the normalised contact, see PatientManager.by_contact
+    contact_index = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)
     encrypted_medical_history = models.TextField()
+    # Per-patient data key wrapped by the master key; empty for legacy rows
+    wrapped_data_key = models.TextField(blank=True, default='')
+
+    objects = PatientManager()
+
+    blind_index_key = settings.BLIND_INDEX_KEY.encode()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The name the doctor-patient graph shows (see hospital.graph)
+        if 'name' in field_names:
+            instance._graph_name = instance.name
+        return instance
+
+    @staticmethod
+    def contact_blind_index(contact):
+        return crypto.blind_index(Patient.blind_index_key, crypto.normalize_contact(contact))
+
+    def save(self, *args, **kwargs):
+        self.contact_index = Patient.contact_blind_index(self.contact)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'contact' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'contact_index'}
+        super().save(*args, **kwargs)
 
     def set_medical_history(self, text):
-        self.encrypted_medical_history = EncryptionHelper.encrypt(text)
+        if not self.wrapped_data_key:
+            self.wrapped_data_key = EncryptionHelper.new_data_key()
+        self.encrypted_medical_history = EncryptionHelper.encrypt(text, self.wrapped_data_key)
 
     def get_medical_history(self):
-        return EncryptionHelper.decrypt(self.encrypted_medical_history)
+        token = self.encrypted_medical_history
+        text = medical_history_cache.get(self.id, token)
+        if text is None:
+            text = EncryptionHelper.decrypt(token, self.wrapped_data_key)
+            medical_history_cache.put(self.id, token, text)
+        return text
+
+    @staticmethod
+    def get_medical_histories(patients):
+        """Decrypted histories for many patients at once, as {patient_id: text}."""
+        histories = {}
+        missing = []
+        for patient in patients:
+            text = medical_history_cache.get(patient.id, patient.encrypted_medical_history)
+            if text is None:
+                missing.append(patient)
+            else:
+                histories[patient.id] = text
+
+        texts = EncryptionHelper.decrypt_many(
+            [p.encrypted_medical_history for p in missing],
+            [p.wrapped_data_key for p in missing],
+        )
+        for patient, text in zip(missing, texts):
+            medical_history_cache.put(patient.id, patient.encrypted_medical_history, text)
+            histories[patient.id] = text
+        return histories
 
 
 # Step 3: Doctor model
 from django.contrib.auth.models import User
 
+
+class CounterField(models.PositiveIntegerField):
+    """
+    A counter maintained with queryset ``update(F(...) + n)``. ``save()``
+    writes it only on insert: updates keep the stored value, so saving
+    an instance loaded before the counter moved cannot undo the change.
+    ``bulk_update()`` and ``update()`` still write it.
+    """
+
+    def pre_save(self, model_instance, add):
+        if add:
+            return super().pre_save(model_instance, add)
+        return models.F(self.attname)
+
+
 class Doctor(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
     specialization = models.CharField(max_length=100)
+    # Patients who granted consent; maintained by hospital.counters. The
+    # database default covers rows inserted outside the ORM (COPY imports)
+    patient_count = CounterField(default=0, db_default=0, editable=False)
 
     def __str__(self):
         return f"{self.name} ({self.specialization})"
 
 
+# Patients who granted consent to at least one doctor of a specialization;
+# maintained by hospital.counters
+class SpecializationCount(models.Model):
+    specialization = models.CharField(max_length=100, unique=True)
+    patient_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.specialization}: {self.patient_count}"
+
+
 
 # Step 4: Consent model
 class Consent(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     granted = models.BooleanField(default=False)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            # One consent row per pair; its index also serves lookups by doctor
+            models.UniqueConstraint(fields=['doctor', 'patient'], name='consent_doctor_patient_uniq'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the patient counters include for this row (see hospital.counters)
+        if {'doctor_id', 'patient_id', 'granted'} <= set(field_names):
+            instance._counted = (instance.doctor_id, instance.patient_id) if instance.granted else None
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The counter updates in post_save commit or roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         status = "Granted" if self.granted else "Revoked"
         return f"{self.patient.name} → {self.doctor.name} ({status})"
 
 
+# Deleted consents, so graph delta syncs can tell clients to drop the edge
+class ConsentTombstone(models.Model):
+    patient_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Consent patient {self.patient_id} → doctor {self.doctor_id} deleted at {self.deleted_at}"
+
+
+# Doctors and patients whose graph node was added, renamed or deleted, so
+# graph delta syncs can update or drop the node
+class GraphNodeChange(models.Model):
+    kind = models.CharField(max_length=10)  # 'doctor' or 'patient'
+    node_id = models.BigIntegerField()
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind.title()} {self.node_id} changed at {self.changed_at}"
+
+
 # Step 5: Access log model
 class AccessLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -78,7 +253,14 @@ class AccessLog(models.Model):
     )
 
     action = models.CharField(max_length=100)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is recorded, not when the buffered batch is written
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the access-log panel walks (timestamp, id)
+            models.Index(fields=['-timestamp', '-id'], name='accesslog_timestamp_id_idx'),
+        ]
 
     def __str__(self):
         actor = (
@@ -97,8 +279,22 @@ class Appointment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     appointment_date = models.DateTimeField()
+    duration_minutes = models.PositiveIntegerField(default=30)
+    # appointment_date + duration; kept as a column for overlap checks
+    ends_at = models.DateTimeField(editable=False)
     notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Calendar feeds read one doctor's appointments in a date window
+            models.Index(fields=['doctor', 'appointment_date'], name='appointment_doctor_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.ends_at = self.appointment_date + datetime.timedelta(minutes=self.duration_minutes)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Appointment: {self.patient.name} with {self.doctor.name} on {self.appointment_date}"
@@ -0,0 +1,57 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque cursor pointing at the row ``(timestamp, pk)``."""
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.split("|")
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+
+    if timestamp is None:
+        raise InvalidCursor(cursor)
+    return timestamp, pk
+
+
+def keyset_page(queryset, cursor=None, page_size=50, field="timestamp"):
+    """
+    Newest-first page of ``queryset`` ordered by ``(field, id)``.
+
+    Rows after the cursor are found with a range condition instead of an
+    OFFSET, so every page costs one index range scan however deep the
+    client has scrolled. Returns ``(rows, next_cursor)``; ``next_cursor``
+    is ``None`` on the last page.
+    """
+    queryset = queryset.order_by(f"-{field}", "-id")
+
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": timestamp}) | Q(**{field: timestamp, "id__lt": pk})
+        )
+
+    # Fetch one extra row to know whether another page exists
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[field], last["id"])
+    return rows, encode_cursor(getattr(last, field), last.id)
@@ -0,0 +1,284 @@
+"""
+Monthly range partitions of the ``hospital_accesslog`` table (PostgreSQL).
+
+Each month lives in its own partition named ``hospital_accesslog_pYYYY_MM``,
+plus a ``hospital_accesslog_default`` partition that catches rows outside
+every monthly range. Partitions older than the retention period are
+written to gzip-compressed NDJSON files and dropped; ``ArchiveReader``
+keeps those months readable.
+
+Rows reach the default partition when maintenance fell behind or are
+backdated. PostgreSQL will not create a month's partition while the
+default holds rows of that month, so ``create_partition`` moves them into
+the new partition first, and ``ensure_partitions`` creates partitions for
+every month found there; those rows are then archived like any other.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+TABLE = "hospital_accesslog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_RE = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+DEFAULT_RETENTION_MONTHS = 12
+
+
+class PartitioningNotSupported(Exception):
+    pass
+
+
+def retention_months():
+    return getattr(settings, "ACCESS_LOG_RETENTION_MONTHS", DEFAULT_RETENTION_MONTHS)
+
+
+def archive_dir():
+    return Path(getattr(settings, "ACCESS_LOG_ARCHIVE_DIR", settings.BASE_DIR / "archive" / "accesslog"))
+
+
+def add_months(year, month, count):
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year, month):
+    return f"{TABLE}_p{year:04d}_{month:02d}"
+
+
+def month_bounds(year, month):
+    """``[start, end)`` of a month in UTC."""
+    start = datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc)
+    next_year, next_month = add_months(year, month, 1)
+    end = datetime.datetime(next_year, next_month, 1, tzinfo=datetime.timezone.utc)
+    return start, end
+
+
+def _check_vendor(conn=connection):
+    if conn.vendor != "postgresql":
+        raise PartitioningNotSupported(
+            f"AccessLog partitioning needs PostgreSQL, not {conn.vendor}"
+        )
+
+
+def is_partitioned(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(conn=connection):
+    """Monthly partitions as a sorted list of ``(year, month)``."""
+    _check_vendor(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    months = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append((int(match.group(1)), int(match.group(2))))
+    return sorted(months)
+
+
+def default_months(conn=connection):
+    """Months with rows in the default partition, as a sorted list of ``(year, month)``."""
+    _check_vendor(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'SELECT DISTINCT date_trunc(\'month\', "timestamp" AT TIME ZONE \'UTC\') FROM "{DEFAULT_PARTITION}"'
+        )
+        return sorted((row[0].year, row[0].month) for row in cursor.fetchall())
+
+
+def create_partition(year, month, conn=connection):
+    """
+    Create the partition for one month if it does not exist yet, moving
+    that month's rows out of the default partition.
+    """
+    _check_vendor(conn)
+    start, end = month_bounds(year, month)
+    name = partition_name(year, month)
+    create = f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)'
+
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        cursor.execute(
+            f'SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s LIMIT 1',
+            [start, end],
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(create, [start, end])
+            return name
+
+        # Detached, the default no longer conflicts with the new range
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"')
+        cursor.execute(create, [start, end])
+        moved = f'FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s'
+        cursor.execute(f'INSERT INTO "{name}" SELECT * {moved}', [start, end])
+        cursor.execute(f'DELETE {moved}', [start, end])
+        cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT')
+    return name
+
+
+def ensure_partitions(months_ahead=3, today=None, conn=connection):
+    """
+    Create partitions for the current month, ``months_ahead`` after it and
+    every month with rows in the default partition.
+    """
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    existing = set(list_partitions(conn))
+
+    months = {add_months(today.year, today.month, offset) for offset in range(months_ahead + 1)}
+    months.update(default_months(conn))
+
+    created = []
+    for year, month in sorted(months - existing):
+        created.append(create_partition(year, month, conn))
+    return created
+
+
+def expired_partitions(retention=None, today=None, conn=connection):
+    """Monthly partitions that ended more than ``retention`` months ago."""
+    retention = retention_months() if retention is None else retention
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    cutoff = add_months(today.year, today.month, -retention)
+    return [ym for ym in list_partitions(conn) if ym < cutoff]
+
+
+# Archival
+
+ARCHIVE_COLUMNS = (
+    "l.id", "l.timestamp", "l.action",
+    "l.user_id", "u.username",
+    "l.doctor_id", "d.name",
+    "l.patient_id", "p.name",
+)
+ARCHIVE_FIELDS = (
+    "id", "timestamp", "action",
+    "user_id", "username",
+    "doctor_id", "doctor_name",
+    "patient_id", "patient_name",
+)
+
+
+def archive_path(year, month, directory=None):
+    return Path(directory or archive_dir()) / f"accesslog-{year:04d}-{month:02d}.ndjson.gz"
+
+
+def archive_partition(year, month, directory=None, conn=connection, chunk_size=5000):
+    """
+    Write one monthly partition to a compressed NDJSON file, then drop it.
+
+    Rows are streamed through a server-side cursor, so memory use does not
+    depend on the partition size. Names of the user, doctor and patient
+    are stored next to their ids so the archive stays readable after
+    those rows are deleted. The partition is only dropped once the file
+    has been fully written and synced to disk.
+    """
+    _check_vendor(conn)
+    name = partition_name(year, month)
+    path = archive_path(year, month, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+    query = (
+        f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM \"{name}\" l "
+        "LEFT JOIN auth_user u ON u.id = l.user_id "
+        "LEFT JOIN hospital_doctor d ON d.id = l.doctor_id "
+        "LEFT JOIN hospital_patient p ON p.id = l.patient_id "
+        "ORDER BY l.timestamp, l.id"
+    )
+
+    rows = 0
+    with transaction.atomic(using=conn.alias):
+        with open(tmp_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            with conn.chunked_cursor() as cursor:
+                cursor.execute(query)
+                while True:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    for row in chunk:
+                        record = dict(zip(ARCHIVE_FIELDS, row))
+                        record["timestamp"] = record["timestamp"].isoformat()
+                        out.write(json.dumps(record).encode() + b"\n")
+                    rows += len(chunk)
+            out.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        os.replace(tmp_path, path)
+
+        with conn.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+
+    return path, rows
+
+
+class ArchiveReader:
+    """Read-only access to archived AccessLog months."""
+
+    FILE_RE = re.compile(r"^accesslog-(\d{4})-(\d{2})\.ndjson\.gz$")
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or archive_dir())
+
+    def months(self):
+        if not self.directory.exists():
+            return []
+        months = []
+        for entry in self.directory.iterdir():
+            match = self.FILE_RE.match(entry.name)
+            if match:
+                months.append((int(match.group(1)), int(match.group(2))))
+        return sorted(months)
+
+    def read(self, year, month):
+        """Yield the entries of one archived month, oldest first."""
+        with gzip.open(archive_path(year, month, self.directory), "rt") as f:
+            for line in f:
+                record = json.loads(line)
+                record["timestamp"] = datetime.datetime.fromisoformat(record["timestamp"])
+                yield record
+
+    def query(self, since=None, until=None, doctor=None, patient=None, action=None):
+        """
+        Yield archived entries matching the filters, oldest first.
+
+        Only the month files overlapping ``[since, until)`` are opened.
+        """
+        for year, month in self.months():
+            start, end = month_bounds(year, month)
+            if (since and end <= since) or (until and start >= until):
+                continue
+
+            for record in self.read(year, month):
+                if since and record["timestamp"] < since:
+                    continue
+                if until and record["timestamp"] >= until:
+                    continue
+                if doctor is not None and record["doctor_id"] != doctor:
+                    continue
+                if patient is not None and record["patient_id"] != patient:
+                    continue
+                if action and action.lower() not in record["action"].lower():
+                    continue
+                yield record
@@ -0,0 +1,157 @@
+"""
+Per-request user roles.
+
+``RoleMiddleware`` resolves the logged-in user's Doctor / Patient profile
+once and sets:
+
+    request.role        "admin", "doctor", "patient", "user" or None (anonymous)
+    request.doctor_id   id of the user's Doctor, or None
+    request.patient_id  id of the user's Patient, or None
+    request.doctor      the Doctor (loaded on first use), or None
+    request.patient     the Patient (loaded on first use), or None
+
+The profile ids are cached per user in the Django cache for
+``ROLE_CACHE_SECONDS`` and dropped when a Doctor or Patient is saved or
+deleted (see signals.py). With the default per-process cache other
+worker processes only notice a relinked profile when their entry
+expires; use a shared cache backend to make invalidation immediate.
+
+The middleware works in both sync and async stacks; under ASGI it looks
+the user and profile ids up with the async ORM and cache APIs.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import Doctor, Patient
+
+ADMIN = "admin"
+DOCTOR = "doctor"
+PATIENT = "patient"
+USER = "user"
+
+
+def _user_key(user_id):
+    return f"hospital:role:{user_id}"
+
+
+def _owner_key(kind, profile_id):
+    return f"hospital:role-owner:{kind}:{profile_id}"
+
+
+def _profile_queries(user_id):
+    return (
+        Doctor.objects.filter(user_id=user_id).values_list("id", flat=True),
+        Patient.objects.filter(user_id=user_id).values_list("id", flat=True),
+    )
+
+
+def _cache_entries(user_id, ids):
+    entries = {_user_key(user_id): ids}
+    # Remember who the profiles belong to, so relinking one can
+    # invalidate the previous owner as well
+    if ids[0] is not None:
+        entries[_owner_key(DOCTOR, ids[0])] = user_id
+    if ids[1] is not None:
+        entries[_owner_key(PATIENT, ids[1])] = user_id
+    return entries
+
+
+def _timeout():
+    return getattr(settings, "ROLE_CACHE_SECONDS", 300)
+
+
+def profile_ids(user):
+    """``(doctor_id, patient_id)`` of ``user``, either possibly None."""
+    if not user.is_authenticated:
+        return None, None
+
+    ids = cache.get(_user_key(user.pk))
+    if ids is None:
+        doctors, patients = _profile_queries(user.pk)
+        ids = (doctors.first(), patients.first())
+        cache.set_many(_cache_entries(user.pk, ids), _timeout())
+    return ids
+
+
+async def aprofile_ids(user):
+    """Async version of ``profile_ids``."""
+    if not user.is_authenticated:
+        return None, None
+
+    ids = await cache.aget(_user_key(user.pk))
+    if ids is None:
+        doctors, patients = _profile_queries(user.pk)
+        ids = (await doctors.afirst(), await patients.afirst())
+        await cache.aset_many(_cache_entries(user.pk, ids), _timeout())
+    return ids
+
+
+def role_of(user, doctor_id, patient_id):
+    if not user.is_authenticated:
+        return None
+    if user.is_superuser:
+        return ADMIN
+    if doctor_id is not None:
+        return DOCTOR
+    if patient_id is not None:
+        return PATIENT
+    return USER
+
+
+def invalidate_profile(kind, profile_id, user_id):
+    """Forget cached roles of the profile's current and previous user."""
+    owner_key = _owner_key(kind, profile_id)
+    keys = [owner_key]
+    previous = cache.get(owner_key)
+    if previous is not None:
+        keys.append(_user_key(previous))
+    if user_id is not None:
+        keys.append(_user_key(user_id))
+    cache.delete_many(keys)
+
+
+def attach(request):
+    """Set the role attributes on ``request`` for ``request.user``."""
+    _set(request, request.user, *profile_ids(request.user))
+
+
+async def aattach(request):
+    """Async version of ``attach``; resolves the user with ``request.auser()``."""
+    user = await request.auser()
+    _set(request, user, *await aprofile_ids(user))
+
+
+def _set(request, user, doctor_id, patient_id):
+    # request.doctor / request.patient load synchronously; async views
+    # should use the ids
+    request.role = role_of(user, doctor_id, patient_id)
+    request.doctor_id = doctor_id
+    request.patient_id = patient_id
+    request.doctor = SimpleLazyObject(lambda: Doctor.objects.get(pk=doctor_id)) if doctor_id else None
+    request.patient = SimpleLazyObject(lambda: Patient.objects.get(pk=patient_id)) if patient_id else None
+
+
+class RoleMiddleware:
+    """Resolve request.role / doctor / patient; must come after AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        attach(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        await aattach(request)
+        return await self.get_response(request)
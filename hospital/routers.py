@@ -0,0 +1,272 @@
+"""
+Primary / replica database routing.
+
+Writes always go to the primary (``default``). Reads go to the primary too,
+except inside views marked with ``@replica_reads``, which read from a
+replica alias listed in ``REPLICA_ROUTING["REPLICAS"]``:
+
+    @replica_reads
+    def patient_distribution(request): ...
+
+Outside views, ``using_replica()`` does the same for a block of code, and
+``read_alias()`` gives an alias for an explicit ``.using()``.
+
+A replica is skipped while its replication lag exceeds ``MAX_LAG_SECONDS``
+(checked at most every ``LAG_CHECK_SECONDS`` per process); with no usable
+replica reads stay on the primary.
+
+Read-your-writes: once a request writes (other than to the models in
+``UNPINNED_MODELS``, such as the access log), the rest of that request and
+the client's requests for the next ``STICKY_SECONDS`` read from the
+primary. ``ReplicaPinMiddleware`` carries that window in a cookie.
+
+Configured through ``settings.REPLICA_ROUTING``:
+
+    REPLICA_ROUTING = {
+        "REPLICAS": ["replica1"],
+        "STICKY_SECONDS": 10,
+        "MAX_LAG_SECONDS": 5,
+        "LAG_CHECK_SECONDS": 5,
+        "UNPINNED_MODELS": ["hospital.accesslog", "sessions.session"],
+    }
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "hospital_primary"
+
+DEFAULTS = {
+    "REPLICAS": [],
+    "STICKY_SECONDS": 10,
+    "MAX_LAG_SECONDS": 5,
+    "LAG_CHECK_SECONDS": 5,
+    "UNPINNED_MODELS": ["hospital.accesslog", "sessions.session"],
+}
+
+
+def conf():
+    return {**DEFAULTS, **getattr(settings, "REPLICA_ROUTING", {})}
+
+
+class RequestState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # the client wrote within STICKY_SECONDS
+        self.wrote = False
+
+
+_request = contextvars.ContextVar("hospital_db_request", default=None)
+# Replica alias chosen for the current @replica_reads view, if any
+_replica = contextvars.ContextVar("hospital_db_replica", default=None)
+
+
+# Replication lag
+
+_lag = {}  # alias -> (checked at, seconds behind or None when unreachable)
+_lag_lock = threading.Lock()
+
+# Seconds since the last replayed transaction, or 0 when the replica has
+# replayed everything it received (an idle primary sends nothing)
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_lag(alias):
+    """Replication lag of ``alias`` in seconds (cached), or None if it cannot be reached."""
+    options = conf()
+    now = time.monotonic()
+    with _lag_lock:
+        entry = _lag.get(alias)
+    if entry is not None and now - entry[0] < options["LAG_CHECK_SECONDS"]:
+        return entry[1]
+
+    connection = connections[alias]
+    try:
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(POSTGRES_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        else:
+            # Local setups point a second alias at the same database
+            connection.ensure_connection()
+            lag = 0.0
+    except DatabaseError:
+        logger.warning("Replica %s is unreachable; reading from the primary", alias, exc_info=True)
+        lag = None
+
+    with _lag_lock:
+        _lag[alias] = (now, lag)
+    return lag
+
+
+def replica_lags():
+    """``{alias: lag}`` as last checked, for the metrics page."""
+    with _lag_lock:
+        return {alias: lag for alias, (_, lag) in _lag.items()}
+
+
+def healthy_replicas():
+    max_lag = conf()["MAX_LAG_SECONDS"]
+    healthy = []
+    for alias in conf()["REPLICAS"]:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            healthy.append(alias)
+    return healthy
+
+
+def read_alias():
+    """Alias to read from now: a healthy replica, or the primary after a write or when none is usable."""
+    state = _request.get()
+    if state is not None and (state.pinned or state.wrote):
+        return DEFAULT_DB_ALIAS
+    replicas = healthy_replicas()
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def using_replica():
+    """Route the block's reads as in a ``@replica_reads`` view."""
+    token = _replica.set(read_alias())
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def replica_reads(view):
+    """Serve the view's reads, including a streamed body, from a replica."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            # The lag check may query the replica
+            alias = await sync_to_async(read_alias)()
+            token = _replica.set(alias)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+            return _route_stream(response, alias)
+        return inner
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        alias = read_alias()
+        token = _replica.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+        return _route_stream(response, alias)
+    return inner
+
+
+def _route_stream(response, alias):
+    # Streamed bodies run their queries after the view has returned
+    if alias == DEFAULT_DB_ALIAS or not response.streaming:
+        return response
+    content = response.streaming_content
+    if response.is_async:
+        async def stream():
+            token = _replica.set(alias)
+            try:
+                async for block in content:
+                    yield block
+            finally:
+                _replica.reset(token)
+    else:
+        def stream():
+            token = _replica.set(alias)
+            try:
+                yield from content
+            finally:
+                _replica.reset(token)
+    response.streaming_content = stream()
+    return response
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None:
+            return None
+        state = _request.get()
+        if state is not None and state.wrote:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower not in conf()["UNPINNED_MODELS"]:
+            state = _request.get()
+            if state is not None:
+                state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *conf()["REPLICAS"]}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in conf()["REPLICAS"]:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Keep a client's reads on the primary for ``STICKY_SECONDS`` after it writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.pin(response, state)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=conf()["STICKY_SECONDS"],
+                httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,177 @@
+"""
+Appointment booking and free-slot search.
+
+Bookings lock the doctor's row and check for overlaps before inserting,
+so two concurrent bookings for the same doctor cannot both succeed. On
+PostgreSQL an exclusion constraint on ``(doctor, [appointment_date,
+ends_at))`` backs this up at the database level.
+"""
+
+import datetime
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import fragments
+from .models import Appointment, Doctor
+
+DEFAULT_DURATION = 30  # minutes
+OVERLAP_CONSTRAINT = 'appointment_no_overlap'
+MAX_SLOTS = 500
+
+
+class AppointmentConflict(Exception):
+    def __init__(self, starts_at):
+        self.starts_at = starts_at
+        super().__init__(f"The doctor already has an appointment overlapping {starts_at}")
+
+
+def clinic_hours():
+    """Opening hours, as local ``datetime.time`` values."""
+    return (
+        getattr(settings, 'CLINIC_DAY_START', datetime.time(9, 0)),
+        getattr(settings, 'CLINIC_DAY_END', datetime.time(17, 0)),
+    )
+
+
+class IntervalIndex:
+    """
+    A doctor's busy time as sorted, merged ``[start, end)`` intervals.
+
+    Overlap checks are a single bisect, so scanning a month of slots
+    against a month of bookings is linear in their sum.
+    """
+
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def blocking(self, start, end):
+        """Index of the busy interval overlapping ``[start, end)``, or None."""
+        i = bisect_right(self.ends, start)
+        if i < len(self.starts) and self.starts[i] < end:
+            return i
+        return None
+
+
+def busy_intervals(doctor_ids, start, end):
+    """``{doctor_id: IntervalIndex}`` of bookings overlapping ``[start, end)``, in one query."""
+    rows = (
+        Appointment.objects
+        .filter(doctor_id__in=doctor_ids, appointment_date__lt=end, ends_at__gt=start)
+        .order_by('doctor_id', 'appointment_date')
+        .values_list('doctor_id', 'appointment_date', 'ends_at')
+    )
+
+    intervals = {doctor_id: [] for doctor_id in doctor_ids}
+    for doctor_id, starts_at, ends_at in rows:
+        intervals[doctor_id].append((starts_at, ends_at))
+    return {doctor_id: IntervalIndex(busy) for doctor_id, busy in intervals.items()}
+
+
+def free_slots(doctors, start, end, duration=DEFAULT_DURATION, limit=MAX_SLOTS):
+    """
+    Free ``duration``-minute slots within clinic hours between ``start``
+    and ``end`` for each of ``doctors`` (a Doctor queryset).
+
+    Returns a list of ``(doctor_id, slot_start, slot_end)`` ordered by
+    doctor then time, at most ``limit`` long.
+    """
+    length = datetime.timedelta(minutes=duration)
+    day_start, day_end = clinic_hours()
+    doctor_ids = list(doctors.order_by('id').values_list('id', flat=True))
+    busy = busy_intervals(doctor_ids, start, end)
+
+    slots = []
+    for doctor_id in doctor_ids:
+        index = busy[doctor_id]
+        day = timezone.localtime(start).date()
+
+        while day <= timezone.localtime(end).date():
+            opens = max(start, timezone.make_aware(datetime.datetime.combine(day, day_start)))
+            closes = min(end, timezone.make_aware(datetime.datetime.combine(day, day_end)))
+
+            moment = opens
+            while moment + length <= closes:
+                blocked = index.blocking(moment, moment + length)
+                if blocked is not None:
+                    # Jump straight past the booking in the way
+                    moment = timezone.localtime(index.ends[blocked])
+                    continue
+
+                slots.append((doctor_id, moment, moment + length))
+                if len(slots) >= limit:
+                    return slots
+                moment += length
+
+            day += datetime.timedelta(days=1)
+
+    return slots
+
+
+def _check_free(doctor, intervals):
+    """Raise AppointmentConflict if any interval overlaps an existing booking or another interval."""
+    first = min(start for start, _ in intervals)
+    last = max(end for _, end in intervals)
+    index = busy_intervals([doctor.id], first, last)[doctor.id]
+
+    for start, end in intervals:
+        if index.blocking(start, end) is not None:
+            raise AppointmentConflict(start)
+
+    ordered = sorted(intervals)
+    for (_, previous_end), (start, _) in zip(ordered, ordered[1:]):
+        if start < previous_end:
+            raise AppointmentConflict(start)
+
+
+def book_appointment(doctor, patient, starts_at, duration=DEFAULT_DURATION, notes=None):
+    """Create one appointment, raising AppointmentConflict if the doctor is busy."""
+    return book_recurring(doctor, patient, starts_at, duration, notes=notes)[0]
+
+
+def book_recurring(doctor, patient, starts_at, duration=DEFAULT_DURATION,
+                   every=datetime.timedelta(weeks=1), count=1, notes=None):
+    """
+    Create ``count`` appointments ``every`` apart in one transaction.
+
+    Either all of them are booked or, if any overlaps an existing
+    appointment, none are and AppointmentConflict is raised.
+    """
+    length = datetime.timedelta(minutes=duration)
+    intervals = [(starts_at + every * n, starts_at + every * n + length) for n in range(count)]
+
+    appointments = [
+        Appointment(
+            patient=patient,
+            doctor=doctor,
+            appointment_date=start,
+            duration_minutes=duration,
+            ends_at=end,
+            notes=notes,
+        )
+        for start, end in intervals
+    ]
+
+    try:
+        with transaction.atomic():
+            # Serialises bookings for this doctor until commit
+            list(Doctor.objects.select_for_update().filter(pk=doctor.pk).values_list('pk'))
+            _check_free(doctor, intervals)
+            # bulk_create sends no post_save signals
+            transaction.on_commit(lambda: fragments.bump('appointments'))
+            return Appointment.objects.bulk_create(appointments)
+    except IntegrityError as exc:
+        # The database exclusion constraint caught an overlap
+        if OVERLAP_CONSTRAINT in str(exc):
+            raise AppointmentConflict(starts_at)
+        raise
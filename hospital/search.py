@@ -0,0 +1,130 @@
+"""
+Ranked patient and doctor search.
+
+On PostgreSQL, matching uses pg_trgm word similarity (typo tolerant) and
+full-text search over names, both backed by the GIN indexes from
+migration 0012. Autocomplete (``prefix=True``) matches names with a word
+starting with the query, or with words starting with each query term. Other
+databases fall back to case-insensitive ``contains``/``startswith``
+matching ordered by name.
+
+Contacts are only matched exactly, through the blind index
+(``Patient.objects.by_contact``), never by substring, which would scan the
+contact column.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Consent, Doctor, Patient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def _terms(query):
+    return re.findall(r"\w+", query)
+
+
+def _postgres():
+    return connection.vendor == "postgresql"
+
+
+def _word_prefix(query):
+    # Case-insensitive regexes can use the trigram indexes; UPPER(name) LIKE cannot
+    return rf"\m{re.escape(query)}"
+
+
+def _contact_match(query):
+    # Only queries with digits can be phone numbers
+    if not re.search(r"\d", query):
+        return Q()
+    return Q(pk__in=Patient.objects.by_contact(query).values("pk"))
+
+
+def patient_matches(queryset, query, prefix=False):
+    """``queryset`` narrowed to patients matching ``query``, best match first."""
+    query = query.strip()
+    if not query:
+        return queryset.none()
+
+    if not _postgres():
+        if prefix:
+            return queryset.filter(Q(name__istartswith=query) | _contact_match(query)).order_by("name", "id")
+        return queryset.filter(Q(name__icontains=query) | _contact_match(query)).order_by("name", "id")
+
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+    # Same expression as patient_name_fts_idx
+    vector = SearchVector("name", config="simple")
+    queryset = queryset.annotate(search=vector, similarity=TrigramWordSimilarity(query, "name"))
+
+    if prefix:
+        terms = _terms(query)
+        match = Q(name__iregex=_word_prefix(query)) | _contact_match(query)
+        if terms:
+            words = SearchQuery(" & ".join(f"{term}:*" for term in terms), search_type="raw", config="simple")
+            match |= Q(search=words)
+        return (
+            queryset.filter(match)
+            .annotate(starts=Case(When(name__iregex=f"^{re.escape(query)}", then=Value(1.0)), default=Value(0.0), output_field=FloatField()))
+            .order_by("-starts", "-similarity", "name", "id")
+        )
+
+    text = SearchQuery(query, search_type="websearch", config="simple")
+    return (
+        queryset.filter(Q(name__trigram_word_similar=query) | Q(search=text) | _contact_match(query))
+        .annotate(rank=Greatest(SearchRank(vector, text), "similarity"))
+        .order_by("-rank", "name", "id")
+    )
+
+
+def doctor_matches(queryset, query, prefix=False):
+    """``queryset`` narrowed to doctors whose name or specialization matches ``query``."""
+    query = query.strip()
+    if not query:
+        return queryset.none()
+
+    if not _postgres():
+        lookup = "istartswith" if prefix else "icontains"
+        return queryset.filter(
+            Q(**{f"name__{lookup}": query}) | Q(**{f"specialization__{lookup}": query})
+        ).order_by("name", "id")
+
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    queryset = queryset.annotate(similarity=Greatest(
+        TrigramWordSimilarity(query, "name"),
+        TrigramWordSimilarity(query, "specialization"),
+    ))
+    if prefix:
+        # Any word may match, so "Sha" finds "Dr. Rahul Sharma"
+        match = Q(name__iregex=_word_prefix(query)) | Q(specialization__iregex=_word_prefix(query))
+    else:
+        match = Q(name__trigram_word_similar=query) | Q(specialization__trigram_word_similar=query)
+    return queryset.filter(match).order_by("-similarity", "name", "id")
+
+
+def search_patients(query, doctor_id=None, prefix=False, limit=DEFAULT_LIMIT):
+    """
+    Patients matching ``query`` as ``[{'id', 'name', 'contact'}]``.
+
+    With ``doctor_id`` only that doctor's patients (granted consent) are
+    searched.
+    """
+    patients = Patient.objects.all()
+    if doctor_id is not None:
+        patients = patients.filter(
+            id__in=Consent.objects.filter(doctor_id=doctor_id, granted=True).values("patient_id")
+        )
+    limit = max(1, min(limit, MAX_LIMIT))
+    return list(patient_matches(patients, query, prefix).values("id", "name", "contact")[:limit])
+
+
+def search_doctors(query, prefix=False, limit=DEFAULT_LIMIT):
+    """Doctors matching ``query`` as ``[{'id', 'name', 'specialization'}]``."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    return list(doctor_matches(Doctor.objects.all(), query, prefix).values("id", "name", "specialization")[:limit])
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import Appointment, Doctor, Patient, Consent, ConsentTombstone
+from . import counters, dashboard, fragments, graph, metrics, roles
+from .consents import consent_index
+
+
+def _invalidate_now_and_on_commit(invalidate, *args):
+    """
+    Run ``invalidate(*args)`` now and again once the transaction commits:
+    another request may re-read the old rows in between, and would cache
+    them until the next change.
+    """
+    invalidate(*args)
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+@receiver(post_save, sender=Consent)
+@receiver(post_delete, sender=Consent)
+def invalidate_consent_index(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(consent_index.invalidate, instance.doctor_id)
+
+
+@receiver(post_delete, sender=Consent)
+def record_consent_tombstone(sender, instance, **kwargs):
+    # Expired tombstones are removed by `manage.py purge_consent_tombstones`
+    ConsentTombstone.objects.create(patient_id=instance.patient_id, doctor_id=instance.doctor_id)
+
+
+@receiver(post_save, sender=Consent)
+@receiver(post_delete, sender=Consent)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_graph_clusters(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(graph.invalidate_cluster_summary)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_user_role(sender, instance, **kwargs):
+    kind = roles.DOCTOR if sender is Doctor else roles.PATIENT
+    roles.invalidate_profile(kind, instance.pk, instance.user_id)
+
+
+@receiver(post_save, sender=Consent)
+@receiver(post_delete, sender=Consent)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_admin_dashboard(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(dashboard.invalidate)
+
+
+FRAGMENT_DOMAINS = {
+    Patient: 'patients',
+    Doctor: 'doctors',
+    Consent: 'consents',
+    Appointment: 'appointments',
+}
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Consent)
+@receiver(post_delete, sender=Consent)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def bump_fragment_version(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(fragments.bump, FRAGMENT_DOMAINS[sender])
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def record_graph_node_change(sender, instance, created, update_fields=None, **kwargs):
+    graph.note_node_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+def record_graph_node_removal(sender, instance, **kwargs):
+    # Expired changes are removed by `manage.py purge_consent_tombstones`
+    graph.note_node_deleted(instance)
+
+
+@receiver(pre_save, sender=Consent)
+def note_counted_consent(sender, instance, **kwargs):
+    counters.consent_saving(instance)
+
+
+@receiver(post_save, sender=Consent)
+def count_saved_consent(sender, instance, **kwargs):
+    counters.consent_saved(instance)
+
+
+@receiver(pre_delete, sender=Consent)
+def note_deleted_consent(sender, instance, origin=None, **kwargs):
+    counters.consent_deleting(instance, origin)
+
+
+@receiver(post_delete, sender=Consent)
+def count_deleted_consent(sender, instance, **kwargs):
+    counters.consent_deleted(instance)
+
+
+@receiver(pre_save, sender=Doctor)
+def note_specialization_change(sender, instance, **kwargs):
+    counters.doctor_saving(instance)
+
+
+@receiver(post_save, sender=Doctor)
+def recount_specializations(sender, instance, **kwargs):
+    counters.doctor_saved(instance)
+
+
+@receiver(connection_created)
+def count_db_connection(sender, connection, **kwargs):
+    metrics.note_db_connection(connection)
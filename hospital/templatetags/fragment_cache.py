@@ -0,0 +1,56 @@
+from django import template
+
+from .. import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, domains, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.domains = domains
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        domains = [domain.strip() for domain in self.domains.resolve(context).split(',')]
+        unknown = set(domains) - set(fragments.DOMAINS)
+        if unknown:
+            raise template.TemplateSyntaxError(f"Unknown fragment domains: {', '.join(sorted(unknown))}")
+        vary_on = [value.resolve(context) for value in self.vary_on]
+
+        # Look each version up once per page, so all its fragments agree
+        seen = context.render_context.get('fragment_versions')
+        if seen is None:
+            seen = context.render_context['fragment_versions'] = {}
+        missing = [domain for domain in domains if domain not in seen]
+        if missing:
+            seen.update(fragments.versions(missing))
+
+        return fragments.get_or_render(
+            name, {domain: seen[domain] for domain in domains}, vary_on,
+            lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Cache the enclosed template under the versions of the given data
+    domains, varying on any further arguments:
+
+        {% fragment "patient-options" "patients" %}...{% endfragment %}
+        {% fragment "doctor-patients" "patients,consents" request.doctor_id %}...{% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name, its data domains and optional vary-on values")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
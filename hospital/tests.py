@@ -1,3 +1,564 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import counters, crypto, fragments, graph, partitions, search
+from .audit import AuditWriter
+from .consents import ConsentIndex
+from .models import (
+    AccessLog, Appointment, Consent, ConsentTombstone, Doctor, EncryptionHelper, GraphNodeChange, Patient,
+    SpecializationCount,
+)
+
+
+def make_patient(name, **fields):
+    return Patient.objects.create(
+        name=name, age=fields.pop('age', 40), contact=fields.pop('contact', '5550100'),
+        encrypted_medical_history=EncryptionHelper.encrypt('No medical history yet.'), **fields,
+    )
+
+
+class PatientCounterTests(TestCase):
+    def setUp(self):
+        self.cardio1 = Doctor.objects.create(name='Dr. A', specialization='Cardio')
+        self.cardio2 = Doctor.objects.create(name='Dr. B', specialization='Cardio')
+        self.neuro = Doctor.objects.create(name='Dr. C', specialization='Neuro')
+        self.patient = make_patient('Asha')
+        self.other = make_patient('Ravi')
+
+    def grant(self, doctor, patient=None, granted=True):
+        return Consent.objects.create(doctor=doctor, patient=patient or self.patient, granted=granted)
+
+    def specialization_count(self, specialization):
+        return SpecializationCount.objects.filter(specialization=specialization).values_list('patient_count', flat=True).first() or 0
+
+    def assertCountersExact(self):
+        self.assertEqual(counters.reconcile(dry_run=True), [])
+
+    def test_distinct_patients_per_specialization(self):
+        self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        self.grant(self.cardio1, self.other)
+        self.assertEqual(self.specialization_count('Cardio'), 2)
+        self.cardio1.refresh_from_db()
+        self.assertEqual(self.cardio1.patient_count, 2)
+        self.assertCountersExact()
+
+    def test_revoke_and_regrant(self):
+        consent = self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        consent.granted = False
+        consent.save()
+        self.assertEqual(self.specialization_count('Cardio'), 1)
+        consent.granted = True
+        consent.save()
+        self.assertCountersExact()
+
+    def test_patient_cascade_decrements_specialization_once(self):
+        self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        self.grant(self.neuro)
+        self.grant(self.cardio1, self.other)
+
+        self.patient.delete()
+
+        self.assertEqual(self.specialization_count('Cardio'), 1)
+        self.assertEqual(self.specialization_count('Neuro'), 0)
+        self.assertCountersExact()
+
+    def test_doctor_cascade_keeps_patients_of_other_doctors(self):
+        self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        self.grant(self.cardio1, self.other)
+
+        self.cardio1.delete()
+
+        self.assertEqual(self.specialization_count('Cardio'), 1)
+        self.assertCountersExact()
+
+    def test_queryset_delete(self):
+        self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        self.grant(self.neuro, granted=False)
+
+        Consent.objects.filter(patient=self.patient).delete()
+
+        self.assertEqual(self.specialization_count('Cardio'), 0)
+        self.assertCountersExact()
+
+    def test_moving_a_consent_to_another_doctor(self):
+        consent = self.grant(self.cardio1)
+        consent.doctor = self.neuro
+        consent.save()
+
+        self.cardio1.refresh_from_db()
+        self.neuro.refresh_from_db()
+        self.assertEqual((self.cardio1.patient_count, self.neuro.patient_count), (0, 1))
+        self.assertEqual((self.specialization_count('Cardio'), self.specialization_count('Neuro')), (0, 1))
+        self.assertCountersExact()
+
+    def test_moving_a_consent_within_a_specialization(self):
+        consent = self.grant(self.cardio1)
+        consent = Consent.objects.get(pk=consent.pk)
+        consent.doctor = self.cardio2
+        consent.save()
+        self.assertEqual(self.specialization_count('Cardio'), 1)
+
+        consent.patient = self.other
+        consent.save()
+        self.assertEqual(self.specialization_count('Cardio'), 1)
+        self.assertCountersExact()
+
+    def test_saving_a_stale_doctor_keeps_the_count(self):
+        stale = Doctor.objects.get(pk=self.cardio1.pk)
+        self.grant(self.cardio1)
+        stale.name = 'Dr. A. Menon'
+        with CaptureQueriesContext(connection) as ctx:
+            stale.save()
+        self.assertCountersExact()
+        # Not even a consent committed during the save can be overwritten
+        update, = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "hospital_doctor"')]
+        self.assertIn('"patient_count" = "hospital_doctor"."patient_count"', update)
+
+    def test_specialization_change_recounts_both(self):
+        self.grant(self.cardio1)
+        self.grant(self.cardio2)
+        self.cardio2.specialization = 'Neuro'
+        self.cardio2.save()
+        self.assertEqual((self.specialization_count('Cardio'), self.specialization_count('Neuro')), (1, 1))
+        self.assertCountersExact()
+
+    def test_force_insert_and_deleted_rows_save_normally(self):
+        Doctor(pk=9999, name='Dr. E', specialization='Derma').save(force_insert=True)
+        doctor = Doctor.objects.get(pk=9999)
+        Doctor.objects.filter(pk=9999).delete()
+        doctor.save()
+        self.assertTrue(Doctor.objects.filter(pk=9999).exists())
+
+    def test_reconcile_repairs_bulk_updates(self):
+        self.grant(self.cardio1)
+        Consent.objects.update(granted=False)
+
+        fixes = counters.reconcile()
+
+        self.assertIn(('specialization', 'Cardio', 1, 0), fixes)
+        self.assertCountersExact()
+
+
+class ImportCounterTests(TestCase):
+    def test_doctor_rows_inserted_outside_the_orm_get_a_count(self):
+        # What the --copy import does on PostgreSQL
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO hospital_doctor (name, specialization) VALUES ('Dr. D', 'Derma')")
+        self.assertEqual(Doctor.objects.get(name='Dr. D').patient_count, 0)
+
+    def test_consent_import_leaves_counters_exact(self):
+        doctors = [Doctor.objects.create(name=f'Dr. {n}', specialization='Cardio') for n in 'AB']
+        patient = make_patient('Asha')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('patient,doctor,granted\n')
+            for doctor in doctors:
+                f.write(f'{patient.id},{doctor.id},true\n')
+            f.flush()
+            call_command('import_hospital_data', 'consents', f.name, '--workers', '0', stdout=StringIO())
+
+        self.assertEqual(SpecializationCount.objects.get(specialization='Cardio').patient_count, 1)
+        self.assertEqual(counters.reconcile(dry_run=True), [])
+
+
+class ImportCommandTests(TestCase):
+    def import_file(self, kind, content, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(content)
+            f.flush()
+            call_command('import_hospital_data', kind, f.name, *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_workers_0_never_starts_the_process_pool(self):
+        rows = ''.join(f'Patient {n},30,Street {n},555010{n}\n' for n in range(3))
+        with mock.patch.object(crypto, 'PARALLEL_THRESHOLD', 2), \
+                mock.patch.object(crypto.os, 'cpu_count', return_value=4), \
+                mock.patch.object(crypto, 'get_pool', side_effect=AssertionError('pool started')):
+            self.import_file('patients', 'name,age,address,contact\n' + rows, '--workers', '0')
+
+        patients = Patient.objects.order_by('id')
+        self.assertEqual(patients.count(), 3)
+        self.assertEqual(patients[0].get_medical_history(), 'No medical history yet.')
+
+
+class FragmentCacheTests(TestCase):
+    template = Template('{% load fragment_cache %}{% fragment "names" "patients" %}{% for p in patients %}{{ p.name }};{% endfor %}{% endfragment %}')
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        return self.template.render(Context({'patients': Patient.objects.order_by('id')}))
+
+    def test_served_from_cache_until_the_domain_changes(self):
+        make_patient('Asha')
+        self.assertEqual(self.render(), 'Asha;')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), 'Asha;')
+
+        make_patient('Ravi')
+        self.assertEqual(self.render(), 'Asha;Ravi;')
+
+    def test_render_before_commit_is_not_kept(self):
+        # A render between the save and the commit sees the old rows
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient('Asha')
+            self.assertEqual(self.template.render(Context({'patients': []})), '')
+        self.assertEqual(self.render(), 'Asha;')
+
+    @override_settings(FRAGMENT_CACHE_SECONDS=3600, FRAGMENT_LOCAL_CACHE_SECONDS=5)
+    def test_per_process_cache_caps_the_lifetime(self):
+        self.assertEqual(fragments.timeout(), 5)
+
+
+class ConsentIndexTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(name='Dr. A', specialization='Cardio')
+        self.patient = make_patient('Asha')
+        self.consent = Consent.objects.create(doctor=self.doctor, patient=self.patient, granted=True)
+        self.index = ConsentIndex()
+
+    def test_changes_reach_other_processes_through_the_doctor_version(self):
+        self.assertTrue(self.index.has_consent(self.doctor.id, self.patient.id))
+        # Saved through another index, as in another worker process
+        self.consent.granted = False
+        self.consent.save()
+        self.assertFalse(self.index.has_consent(self.doctor.id, self.patient.id))
+
+        self.consent.granted = True
+        self.consent.save()
+        self.assertTrue(self.index.has_consent(self.doctor.id, self.patient.id))
+        self.assertEqual(self.index.stats()['stale'], 2)
+
+    def test_cached_answers_cost_no_query(self):
+        self.index.has_consent(self.doctor.id, self.patient.id)
+        self.index.has_consent(self.doctor.id, self.patient.id + 1)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.index.has_consent(self.doctor.id, self.patient.id))
+            self.assertFalse(self.index.has_consent(self.doctor.id, self.patient.id + 1))
+
+    def test_invalidate_all_after_a_queryset_update(self):
+        self.index.has_consent(self.doctor.id, self.patient.id)
+        Consent.objects.update(granted=False)
+        self.index.invalidate()
+        self.assertFalse(self.index.has_consent(self.doctor.id, self.patient.id))
+
+    @override_settings(CONSENT_CACHE={'TTL': 0})
+    def test_per_process_cache_expires_answers(self):
+        index = ConsentIndex.from_settings()
+        index.has_consent(self.doctor.id, self.patient.id)
+        with self.assertNumQueries(1):
+            index.has_consent(self.doctor.id, self.patient.id)
+
+
+class AuditWriterTests(TransactionTestCase):
+    def test_entries_of_a_rolled_back_transaction_are_not_written(self):
+        writer = AuditWriter(mode='commit')
+        with self.assertRaises(ValueError), transaction.atomic():
+            writer.record(action='Viewed patient record')
+            raise ValueError
+        writer.flush()
+        self.assertFalse(AccessLog.objects.exists())
+
+    def test_entries_are_written_when_their_transaction_commits(self):
+        writer = AuditWriter(mode='commit')
+        with transaction.atomic():
+            writer.record(action='Viewed patient record')
+            self.assertFalse(AccessLog.objects.exists())
+        self.assertEqual(AccessLog.objects.count(), 1)
+
+    def test_a_rollback_does_not_lose_other_requests_entries(self):
+        writer = AuditWriter(mode='commit', batch_size=2)
+        writer.record(action='Other request')
+        # This request's entry would reach the batch size inside its transaction
+        with self.assertRaises(ValueError), transaction.atomic():
+            writer.record(action='Rolled back')
+            writer.flush()
+            raise ValueError
+        writer.flush()
+        self.assertEqual(list(AccessLog.objects.values_list('action', flat=True)), ['Other request'])
+
+
+class GraphDataTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(name='Dr. A', specialization='Cardio')
+        self.patient = make_patient('Asha')
+        Consent.objects.create(doctor=self.doctor, patient=self.patient, granted=True)
+
+    def test_graph_data_requires_login(self):
+        for name in ('doctor_patient_graph_data', 'doctor_patient_graph_data_async'):
+            response = self.client.get(reverse(name), {'since': '0'})
+            self.assertEqual(response.status_code, 302, name)
+
+        User.objects.create_user('staff', password='pw')
+        self.client.login(username='staff', password='pw')
+        self.assertEqual(self.client.get(reverse('doctor_patient_graph_data')).status_code, 200)
+
+    def test_cascade_records_tombstones_without_purging(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.patient.delete()
+        self.assertEqual(ConsentTombstone.objects.count(), 1)
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE') and 'consenttombstone' in q['sql']]
+        self.assertEqual(deletes, [])
+
+    def test_purge_keeps_tombstones_inside_the_sync_window(self):
+        old = ConsentTombstone.objects.create(patient_id=1, doctor_id=1)
+        ConsentTombstone.objects.filter(pk=old.pk).update(deleted_at=timezone.now() - graph.sync_window() - datetime.timedelta(days=1))
+        ConsentTombstone.objects.create(patient_id=2, doctor_id=1)
+
+        self.assertEqual(graph.purge_tombstones(dry_run=True), 1)
+        self.assertEqual(graph.purge_tombstones(), 1)
+        self.assertEqual(list(ConsentTombstone.objects.values_list('patient_id', flat=True)), [2])
+
+
+    def test_state_reads_maxima_without_counting(self):
+        with CaptureQueriesContext(connection) as ctx:
+            graph.graph_state()
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_delta_relabels_and_removes_nodes(self):
+        User.objects.create_user('staff', password='pw')
+        self.client.login(username='staff', password='pw')
+        since = graph.graph_state()
+        other = make_patient('Ravi')
+        Consent.objects.create(doctor=self.doctor, patient=other, granted=True)
+
+        self.doctor.name = 'Dr. B'
+        self.doctor.save()
+        other_id = other.id
+        other.delete()
+        for name in ('doctor_patient_graph_data', 'doctor_patient_graph_data_async'):
+            delta = self.client.get(reverse(name), {'since': since}).json()
+            self.assertFalse(delta['reset'])
+            self.assertNotEqual(delta['version'], since)
+            labels = {element['data']['id']: element['data'].get('label') for element in delta['added']}
+            self.assertEqual(labels[f'doctor_{self.doctor.id}'], 'Dr. B (Cardio)')
+            self.assertIn(f'patient_{other_id}', delta['removed'])
+
+    def test_saves_that_keep_the_node_record_nothing(self):
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.age += 1
+        patient.save()
+        self.doctor.save(update_fields=['user'])
+        self.assertEqual(GraphNodeChange.objects.count(), 1)  # creating the doctor
+
+        patient.name = 'Asha R.'
+        patient.save()
+        self.assertEqual(GraphNodeChange.objects.filter(kind='patient').count(), 1)
+
+
+class ContactIndexTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient('Asha', contact='555-0101')
+
+    def test_save_keeps_the_index_current(self):
+        self.assertEqual(self.patient.contact_index, Patient.contact_blind_index('5550101'))
+        self.patient.contact = '555 0199'
+        self.patient.save(update_fields=['contact'])
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.contact_index, Patient.contact_blind_index('5550199'))
+
+    def test_by_contact_matches_exact_numbers_only(self):
+        self.assertEqual(list(Patient.objects.by_contact('(555) 0101')), [self.patient])
+        self.assertFalse(Patient.objects.by_contact('555010').exists())
+
+    def test_backfill(self):
+        Patient.objects.update(contact_index='')
+        call_command('backfill_contact_index', chunk_size=1, stdout=StringIO())
+        self.assertEqual(list(Patient.objects.by_contact('5550101')), [self.patient])
+
+        Patient.objects.update(contact_index='stale')
+        call_command('backfill_contact_index', stdout=StringIO())
+        self.assertFalse(Patient.objects.by_contact('5550101').exists())
+        call_command('backfill_contact_index', all=True, stdout=StringIO())
+        self.assertEqual(list(Patient.objects.by_contact('5550101')), [self.patient])
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.asha = make_patient('Asha Rao', contact='555-0101')
+        self.bela = make_patient('Bela Rao', contact='5550199')
+
+    def test_contact_matches_the_whole_number_in_any_format(self):
+        for query in ('5550101', '555 0101', '555-0101'):
+            self.assertEqual(list(search.patient_matches(Patient.objects.all(), query)), [self.asha], query)
+
+    def test_contact_is_not_matched_by_substring(self):
+        for prefix in (False, True):
+            self.assertFalse(search.patient_matches(Patient.objects.all(), '555', prefix).exists())
+
+    def test_contact_column_is_not_scanned(self):
+        sql = str(search.patient_matches(Patient.objects.all(), '5550101').query)
+        self.assertNotIn('"contact" LIKE', sql)
+        self.assertIn('contact_index', sql)
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('doc', password='pw')
+        doctor = Doctor.objects.create(user=user, name='Dr. A', specialization='Cardio')
+        patient = make_patient('Asha')
+        start = timezone.now()
+        self.first, self.second = (
+            Appointment.objects.create(doctor=doctor, patient=patient, appointment_date=start + datetime.timedelta(days=day))
+            for day in (1, 2)
+        )
+        self.client.login(username='doc', password='pw')
+
+    def test_deleting_an_appointment_is_not_reported_as_unmodified(self):
+        for name in ('appointments_json', 'appointments_json_async'):
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+                self.assertNotIn('Last-Modified', response)
+                etag = response['ETag']
+                Appointment.objects.filter(pk=self.first.pk).delete()
+
+                response = self.client.get(reverse(name), HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), 1)
+                self.assertNotEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+                self.first.save()
+
+
+class PartitionTests(TestCase):
+    def test_add_months_crosses_years(self):
+        self.assertEqual(partitions.add_months(2026, 11, 3), (2027, 2))
+        self.assertEqual(partitions.add_months(2026, 1, -1), (2025, 12))
+        self.assertEqual(partitions.add_months(2026, 5, -17), (2024, 12))
+
+    def test_month_bounds(self):
+        start, end = partitions.month_bounds(2026, 12)
+        self.assertEqual(start, datetime.datetime(2026, 12, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(end, datetime.datetime(2027, 1, 1, tzinfo=datetime.timezone.utc))
+
+    @mock.patch.object(partitions, 'list_partitions', return_value=[(2025, 9), (2025, 10), (2025, 11), (2026, 10)])
+    def test_expired_partitions(self, list_partitions):
+        today = datetime.date(2026, 10, 18)
+        self.assertEqual(partitions.expired_partitions(12, today), [(2025, 9)])
+        self.assertEqual(partitions.expired_partitions(11, today), [(2025, 9), (2025, 10)])
+
+    @mock.patch.object(partitions, 'create_partition', side_effect=lambda year, month, conn: partitions.partition_name(year, month))
+    @mock.patch.object(partitions, 'default_months', return_value=[(2026, 7)])
+    @mock.patch.object(partitions, 'list_partitions', return_value=[(2026, 10)])
+    def test_ensure_partitions_covers_months_in_the_default_partition(self, *mocks):
+        created = partitions.ensure_partitions(1, datetime.date(2026, 10, 18))
+        self.assertEqual(created, ['hospital_accesslog_p2026_07', 'hospital_accesslog_p2026_11'])
+
+
+class ArchiveReaderTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.write(2026, 8, [(1, '2026-08-31T23:00:00+00:00', 'Viewed patient record', 1, 1)])
+        self.write(2026, 9, [
+            (2, '2026-09-01T00:00:00+00:00', 'Viewed patient record', 1, 2),
+            (3, '2026-09-15T12:00:00+00:00', 'Updated medical history', 2, 2),
+        ])
+        self.reader = partitions.ArchiveReader(self.directory.name)
+
+    def write(self, year, month, rows):
+        with gzip.open(partitions.archive_path(year, month, self.directory.name), 'wt') as f:
+            for id, timestamp, action, doctor_id, patient_id in rows:
+                f.write(json.dumps({'id': id, 'timestamp': timestamp, 'action': action, 'doctor_id': doctor_id, 'patient_id': patient_id}) + '\n')
+
+    def ids(self, **filters):
+        return [record['id'] for record in self.reader.query(**filters)]
+
+    def test_months(self):
+        self.assertEqual(self.reader.months(), [(2026, 8), (2026, 9)])
+
+    def test_filters(self):
+        utc = datetime.timezone.utc
+        self.assertEqual(self.ids(), [1, 2, 3])
+        self.assertEqual(self.ids(since=datetime.datetime(2026, 9, 1, tzinfo=utc)), [2, 3])
+        self.assertEqual(self.ids(until=datetime.datetime(2026, 9, 1, tzinfo=utc)), [1])
+        self.assertEqual(self.ids(doctor=2), [3])
+        self.assertEqual(self.ids(patient=2, action='viewed'), [2])
+
+    def test_skips_months_outside_the_window(self):
+        with mock.patch.object(self.reader, 'read', wraps=self.reader.read) as read:
+            self.ids(since=datetime.datetime(2026, 9, 2, tzinfo=datetime.timezone.utc))
+        read.assert_called_once_with(2026, 9)
+
+
+class QueryBudgetTests(TestCase):
+    # Views whose query count must not grow with the data, by URL name
+    VIEWS = (
+        ('dashboard', 'admin'),
+        ('dashboard', 'doc'),
+        ('patient_distribution', 'admin'),
+        ('doctor_patient_graph_data', 'admin'),
+        ('doctor_patient_graph_data_async', 'admin'),
+        ('doctor_patient_graph_clusters', 'admin'),
+        ('doctor_patient_graph_clusters_async', 'admin'),
+        ('access_logs_json', 'admin'),
+        ('appointments_json', 'doc'),
+        ('appointments_json_async', 'doc'),
+    )
+
+    def setUp(self):
+        User.objects.create_superuser('admin', password='pw')
+        self.seed(1)
+        doctor = Doctor.objects.order_by('id').first()
+        doctor.user = User.objects.create_user('doc', password='pw')
+        doctor.save(update_fields=['user'])
+
+    def seed(self, seed):
+        call_command(
+            'seed_synthetic_hospital', doctors=5, patients=20, appointments=20, logs=40,
+            seed=seed, stdout=StringIO(),
+        )
+
+    def login(self, username):
+        self.client.force_login(User.objects.get(username=username))
+        # Cold caches, so both sizes run the same queries
+        cache.clear()
+
+    def fetch(self, name):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200, name)
+        # Streamed bodies only run their queries as they are read
+        if response.streaming and response.is_async:
+            async_to_sync(self.aread)(response)
+        elif response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    @staticmethod
+    async def aread(response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    def test_query_count_does_not_grow_with_the_data(self):
+        budgets = {}
+        for name, username in self.VIEWS:
+            self.login(username)
+            with CaptureQueriesContext(connection) as ctx:
+                self.fetch(name)
+            budgets[name, username] = len(ctx.captured_queries)
+
+        self.seed(2)
+        self.seed(3)
+        for (name, username), budget in budgets.items():
+            self.login(username)
+            with self.subTest(view=name, user=username), self.assertNumQueries(budget):
+                self.fetch(name)
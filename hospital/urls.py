@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('login/', views.custom_login, name='login'),
@@ -11,6 +11,8 @@ urlpatterns = [
     path('patient-distribution/', views.patient_distribution, name='patient_distribution'),
     path('graph/', views.doctor_patient_graph, name='doctor_patient_graph'),
     path('graph/data/', views.doctor_patient_graph_data, name='doctor_patient_graph_data'),
+    path('graph/clusters/', views.doctor_patient_graph_clusters, name='doctor_patient_graph_clusters'),
+    path('graph/clusters/<int:doctor_id>/', views.doctor_patient_graph_cluster_patients, name='doctor_patient_graph_cluster_patients'),
 
     path('add-doctor/', views.add_doctor, name='add_doctor'),
     path('remove-doctor/', views.remove_doctor, name='remove_doctor'),
@@ -27,6 +29,17 @@ urlpatterns = [
     path("patient/dashboard/", views.patient_dashboard, name="patient_dashboard"),
     path('patient/<int:patient_id>/update-history/', views.update_medical_history, name='update_medical_history'),
     path("appointments-json/", views.appointments_json, name="appointments_json"),
+    path("appointment-slots/", views.available_slots, name="available_slots"),
+    path("access-logs-json/", views.access_logs_json, name="access_logs_json"),
+    path("export/<str:entity>/", views.export_data, name="export_data"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("search/", views.search_json, name="search"),
+
+    # Async versions of the JSON read endpoints, for ASGI deployments
+    path("async/appointments-json/", async_views.appointments_json, name="appointments_json_async"),
+    path("async/graph/data/", async_views.doctor_patient_graph_data, name="doctor_patient_graph_data_async"),
+    path("async/graph/clusters/", async_views.doctor_patient_graph_clusters, name="doctor_patient_graph_clusters_async"),
+    path("async/graph/clusters/<int:doctor_id>/", async_views.doctor_patient_graph_cluster_patients, name="doctor_patient_graph_cluster_patients_async"),
 ]
 
 
@@ -1,16 +1,16 @@
-from .models import AccessLog, Doctor
+from . import audit
 
 def log_action(request, patient, action):
-    try:
-        doctor = Doctor.objects.get(user=request.user)
-        AccessLog.objects.create(
-            doctor=doctor,
+    # request.doctor_id is set by roles.RoleMiddleware
+    if request.doctor_id is not None:
+        audit.record(
+            doctor_id=request.doctor_id,
             patient=patient,
             action=action
         )
-    except Doctor.DoesNotExist:
-        AccessLog.objects.create(
+    else:
+        audit.record(
             user=request.user,
             patient=patient,
             action=action
-        )
\ No newline at end of file
+        )
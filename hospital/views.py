@@ -1,16 +1,34 @@
+import datetime
+
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition
+from django.db.models import Count, Max
 
 from .models import Patient, Doctor, Consent, AccessLog
 from .forms import DoctorForm, PatientForm, ConsentForm, DoctorRegisterForm, PatientRegistrationForm
 from .models import Appointment
 from .utils import log_action
+from . import audit
+from . import counters
+from . import export
+from . import graph
+from . import metrics
+from . import roles
+from . import scheduling
+from . import search
+from .consents import consent_index
+from .pagination import keyset_page, InvalidCursor
+from .routers import replica_reads
 
 def is_doctor(user):
-    return Doctor.objects.filter(user=user).exists()
+    # Cached per user, see roles.py
+    return roles.profile_ids(user)[0] is not None
 
 def is_admin(user):
     return user.is_superuser
@@ -19,58 +37,36 @@ def is_admin(user):
 # Dashboard
 @login_required
 def dashboard(request):
+    # The lists, dropdowns and chart data are cached template fragments
+    # (see fragments.py), so everything passed here stays lazy and is only
+    # queried when a fragment has to be rendered again
     patients = Patient.objects.all()
 
-    # Bar Chart Data
-    chart_data = []
-    for doctor in Doctor.objects.all():
-        patients_with_consent = Patient.objects.filter(consent__doctor=doctor, consent__granted=True)
-        chart_data.append({
-            'doctor': doctor.name,
-            'patients': list(patients_with_consent.values('id', 'name'))
-        })
-
-    # Graph Data
-    nodes = []
-    edges = []
-    for doctor in Doctor.objects.all():
-        nodes.append({
-            'data': {'id': f'doctor_{doctor.id}', 'label': doctor.name, 'type': 'doctor'}
-        })
-
-        patient_list = Patient.objects.filter(consent__doctor=doctor, consent__granted=True)
-        for patient in patient_list:
-            if not any(n['data']['id'] == f'patient_{patient.id}' for n in nodes):
-                nodes.append({
-                    'data': {'id': f'patient_{patient.id}', 'label': patient.name, 'type': 'patient'}
-                })
+    # Bar chart data: one row per doctor from the maintained counters
+    # (called by the template); the graph itself is loaded on demand from
+    # the cluster endpoints
+    chart_data = counters.chart_data
 
-            edges.append({
-                'data': {'source': f'patient_{patient.id}', 'target': f'doctor_{doctor.id}'}
-            })
-
-    graph_data = {'nodes': nodes, 'edges': edges}
-
-    
-    doctor_user = Doctor.objects.filter(user=request.user).exists()
+    doctor_user = request.doctor_id is not None
 
     doctor_patients = []
     if doctor_user:
-        doctor_patients = Patient.objects.filter(consent__doctor=doctor_user, consent__granted=True)
-
-    access_logs = AccessLog.objects.select_related("user", "doctor", "patient").order_by("-timestamp")
+        doctor_patients = (
+            Patient.objects
+            .filter(consent__doctor_id=request.doctor_id, consent__granted=True)
+            .order_by('id')
+            .values('id', 'name')
+        )
 
     return render(request, 'hospital/dashboard.html', {
             'patients': patients,
             'chart_data': chart_data,
-            'graph_data': graph_data,
             'add_doctor_form': DoctorForm(),
             'add_patient_form': PatientForm(),
             'consent_form': ConsentForm(),
             'doctors': Doctor.objects.all(),
             'doctor_user': doctor_user, 
             'doctor_patients': doctor_patients,
-            "access_logs": access_logs
     })
 
 
@@ -80,10 +76,10 @@ def dashboard(request):
 def patient_detail(request, patient_id):
     patient = Patient.objects.get(id=patient_id)
 
-    AccessLog.objects.create(user=request.user, patient=patient, action="Viewed patient record")
+    audit.record(user=request.user, patient=patient, action="Viewed patient record")
 
-    consents = Consent.objects.filter(patient=patient, doctor__name=request.user.username, granted=True)
-    medical_history = patient.get_medical_history() if consents.exists() else "Access Denied"
+    has_consent = request.doctor_id is not None and consent_index.has_consent(request.doctor_id, patient.id)
+    medical_history = patient.get_medical_history() if has_consent else "Access Denied"
 
     return render(request, 'hospital/patient_detail.html', {
         'patient': patient,
@@ -92,54 +88,74 @@ def patient_detail(request, patient_id):
 
 
 #  Bar chart page
+@replica_reads
 def patient_distribution(request):
-    data = []
-    for doctor in Doctor.objects.all():
-        patients = Patient.objects.filter(consent__doctor=doctor, consent__granted=True)
-        data.append({
-            'doctor': doctor.name,
-            'patients': list(patients.values('id', 'name'))
-        })
+    data = counters.chart_data()
     return render(request, 'hospital/patient_distribution.html', {'data': data})
 
 
 #  Graph HTML page
+@login_required
 def doctor_patient_graph(request):
     return render(request, 'hospital/doctor_patient_graph.html')
 
 
 #  Graph Data API
+def _graph_etag(request):
+    request.graph_version = graph.graph_state()
+    mode = "delta" if "since" in request.GET else "full"
+    return f'"{mode}-{request.graph_version}"'
+
+
+@replica_reads
+@login_required
+@condition(etag_func=_graph_etag)
 def doctor_patient_graph_data(request):
-    elements = []
+    version = request.graph_version
+
+    #  Delta mode: only changes since the client's last version
+    if "since" in request.GET:
+        try:
+            since = graph.from_version(request.GET["since"])
+        except (ValueError, OverflowError):
+            return JsonResponse({"error": "Invalid version"}, status=400)
+
+        if since < timezone.now() - graph.sync_window():
+            return JsonResponse({"version": version, "reset": True})
+
+        return JsonResponse({"version": version, "reset": False, **graph.graph_delta(since)})
+
+    #  Full mode: stream deduplicated nodes and edges
+    response = StreamingHttpResponse(
+        graph.stream_json_array(graph.iter_graph_elements()),
+        content_type="application/json",
+    )
+    response["X-Graph-Version"] = version
+    return response
 
-    doctors = Doctor.objects.all()
-    for d in doctors:
-        elements.append({
-            'data': {
-                'id': f'doctor_{d.id}',
-                'label': f"{d.name} ({d.specialization})",
-                'type': 'doctor'
-            }
-        })
 
-    for p in Patient.objects.all():
-        consents = Consent.objects.filter(patient=p, granted=True)
-        for c in consents:
-            elements.append({
-                'data': {
-                    'id': f'patient_{p.id}',
-                    'label': p.name,
-                    'type': 'patient'
-                }
-            })
-            elements.append({
-                'data': {
-                    'source': f'patient_{p.id}',
-                    'target': f'doctor_{c.doctor.id}'
-                }
-            })
-
-    return JsonResponse(elements, safe=False)
+#  Aggregated graph: cluster summary
+@login_required
+def doctor_patient_graph_clusters(request):
+    return JsonResponse(graph.cluster_summary(), safe=False)
+
+
+#  Aggregated graph: patients of one doctor cluster, paginated
+GRAPH_CLUSTER_PAGE_SIZE = 100
+GRAPH_CLUSTER_MAX_PAGE_SIZE = 500
+
+@replica_reads
+@login_required
+def doctor_patient_graph_cluster_patients(request, doctor_id):
+    try:
+        after = int(request.GET.get("cursor", 0))
+        limit = int(request.GET.get("limit", GRAPH_CLUSTER_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    limit = max(1, min(limit, GRAPH_CLUSTER_MAX_PAGE_SIZE))
+
+    elements, next_cursor = graph.cluster_patients(doctor_id, after, limit)
+    return JsonResponse({"elements": elements, "next": next_cursor})
 
 
 #  Custom Login
@@ -152,17 +168,16 @@ def custom_login(request):
 
         if user:
             login(request, user)
+            roles.attach(request)
 
             #  ROLE-BASED REDIRECTION
-            if user.is_superuser:
+            if request.role == roles.ADMIN:
                 return redirect("dashboard")  # Admin dashboard
 
-            #  Doctor user has OneToOne relation: doctor.user → User
-            if hasattr(user, "doctor"):
+            if request.role == roles.DOCTOR:
                 return redirect("dashboard")  # Doctor dashboard (same UI)
 
-            #  Patient user has OneToOne relation: patient.user → User
-            if hasattr(user, "patient"):
+            if request.role == roles.PATIENT:
                 return redirect("patient_dashboard")  # Redirect patient to patient dashboard
 
             # Default fallback
@@ -180,7 +195,7 @@ def add_doctor(request):
         if form.is_valid():
             doctor = form.save()
 
-            AccessLog.objects.create(
+            audit.record(
                 user=request.user,
                 action=f"Added Doctor {doctor.name}"
             )
@@ -209,7 +224,7 @@ def remove_doctor(request):
             doctor.delete()
 
             #  Log admin action
-            AccessLog.objects.create(
+            audit.record(
                 user=request.user,
                 action=f"Removed Doctor {doctor_name}"
             )
@@ -250,7 +265,7 @@ def remove_patient(request):
             patient.delete()
 
             #  Admin action log
-            AccessLog.objects.create(
+            audit.record(
                 user=request.user,
                 action=f"Removed Patient {patient_name}"
             )
@@ -264,7 +279,7 @@ def remove_patient(request):
 @login_required
 @user_passes_test(is_doctor)
 def add_appointment(request):
-    doctor = Doctor.objects.get(user=request.user)
+    doctor = request.doctor
 
     if request.method == "POST":
         patient_id = request.POST.get("patient")
@@ -276,19 +291,36 @@ def add_appointment(request):
             messages.error(request, "Patient not found.")
             return redirect("dashboard")
 
-        # Create the appointment
-        appointment = Appointment.objects.create(
-            patient=patient,
-            doctor=doctor,
-            appointment_date=date,
-            notes=notes
-        )
+        try:
+            starts_at = _parse_calendar_bound(date)
+            duration = int(request.POST.get("duration") or scheduling.DEFAULT_DURATION)
+            repeat_weeks = int(request.POST.get("repeat_weeks") or 1)
+        except ValueError:
+            starts_at = None
+        if starts_at is None or duration < 1 or not 1 <= repeat_weeks <= 52:
+            messages.error(request, "Invalid appointment date, duration or repeat count.")
+            return redirect("dashboard")
+
+        # Create the appointment(s), refusing overlaps with existing bookings
+        try:
+            scheduling.book_recurring(
+                doctor, patient, starts_at,
+                duration=duration,
+                count=repeat_weeks,
+                notes=notes,
+            )
+        except scheduling.AppointmentConflict as conflict:
+            messages.error(request, f"You already have an appointment overlapping {timezone.localtime(conflict.starts_at):%Y-%m-%d %H:%M}.")
+            return redirect("dashboard")
 
         # Log doctor action
-        AccessLog.objects.create(
+        action = f"Created Appointment on {date}"
+        if repeat_weeks > 1:
+            action += f" (weekly x{repeat_weeks})"
+        audit.record(
             doctor=doctor,
             patient=patient,
-            action=f"Created Appointment on {date}"
+            action=action
         )
 
         messages.success(request, "Appointment added successfully.")
@@ -352,10 +384,10 @@ def doctor_register(request):
 
             #  Link doctor to user
             doctor.user = user
-            doctor.save()
+            doctor.save(update_fields=['user'])
 
             #  Log registration
-            AccessLog.objects.create(
+            audit.record(
                 user=user,
                 action=f"Doctor account registered for {doctor.name}",
                 patient=None  # No patient involved
@@ -393,7 +425,7 @@ def patient_register(request):
             patient.save()
 
             #  Access Log
-            AccessLog.objects.create(
+            audit.record(
                 user=user,
                 patient=patient,
                 action="Patient Registered"
@@ -417,9 +449,8 @@ from .models import Patient, Appointment, Consent
 @login_required
 def patient_dashboard(request):
     # Ensure logged-in user is actually a patient
-    try:
-        patient = Patient.objects.get(user=request.user)
-    except Patient.DoesNotExist:
+    patient = request.patient
+    if patient is None:
         messages.error(request, "You are not registered as a patient.")
         return redirect("dashboard")  # fallback for doctor/admin
 
@@ -439,11 +470,11 @@ from django.shortcuts import get_object_or_404
 @login_required
 @user_passes_test(is_doctor)
 def update_medical_history(request, patient_id):
-    doctor = get_object_or_404(Doctor, user=request.user)
+    doctor = request.doctor
     patient = get_object_or_404(Patient, id=patient_id)
 
     #  Check if doctor has consent
-    if not Consent.objects.filter(doctor=doctor, patient=patient, granted=True).exists():
+    if not consent_index.has_consent(doctor.id, patient.id):
         messages.error(request, "You do not have consent to update this patient's medical history.")
         return redirect("dashboard")
 
@@ -458,7 +489,7 @@ def update_medical_history(request, patient_id):
             patient.save()
 
             #  LOG ACTION
-            AccessLog.objects.create(
+            audit.record(
                 doctor=doctor,
                 patient=patient,
                 action="Updated Medical History"
@@ -473,7 +504,7 @@ def update_medical_history(request, patient_id):
         form = DoctorMedicalHistoryForm(initial=initial_data)
 
         #  OPTIONAL: log that doctor viewed medical history edit page
-        AccessLog.objects.create(
+        audit.record(
             doctor=doctor,
             patient=patient,
             action="Viewed Medical History Update Page"
@@ -487,17 +518,265 @@ def update_medical_history(request, patient_id):
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 
+#  Calendar feed: one doctor's appointments in FullCalendar's start/end window
+CALENDAR_DEFAULT_DAYS_BEFORE = 31
+CALENDAR_DEFAULT_DAYS_AFTER = 62
+CALENDAR_MAX_WINDOW_DAYS = 400
+
+def _parse_calendar_bound(value):
+    # FullCalendar sends ISO datetimes, or plain dates in some views
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def calendar_window(doctor_id, params):
+    """The doctor's appointments in the requested window; ValueError on a bad bound."""
+    if doctor_id is None:
+        return Appointment.objects.none()
+
+    now = timezone.now()
+    start = _parse_calendar_bound(params.get("start")) or now - datetime.timedelta(days=CALENDAR_DEFAULT_DAYS_BEFORE)
+    end = _parse_calendar_bound(params.get("end")) or now + datetime.timedelta(days=CALENDAR_DEFAULT_DAYS_AFTER)
+    end = min(end, start + datetime.timedelta(days=CALENDAR_MAX_WINDOW_DAYS))
+
+    return Appointment.objects.filter(
+        doctor_id=doctor_id,
+        appointment_date__gte=start,
+        appointment_date__lt=end,
+    )
+
+
+CALENDAR_SUMMARY = {"total": Count("id"), "changed": Max("updated_at"), "last_id": Max("id")}
+NO_APPOINTMENTS = {"total": 0, "changed": None, "last_id": None}
+
+
+def _calendar_appointments(request):
+    """Queryset for the requested window, plus its (count, last change) summary."""
+    if hasattr(request, "calendar_appointments"):
+        return request.calendar_appointments
+
+    appointments = calendar_window(request.doctor_id, request.GET)
+    summary = appointments.aggregate(**CALENDAR_SUMMARY) if request.doctor_id is not None else NO_APPOINTMENTS
+
+    request.calendar_appointments = (appointments, summary)
+    return request.calendar_appointments
+
+
+def calendar_etag_for(user_id, summary):
+    changed = summary["changed"].timestamp() if summary["changed"] else 0
+    return f'"{user_id}-{summary["total"]}-{summary["last_id"]}-{changed}"'
+
+
+def calendar_events(rows):
+    return [
+        {
+            "title": patient_name,
+            "start": appointment_date.isoformat(),
+            "description": notes or ""
+        }
+        for appointment_date, notes, patient_name in rows
+    ]
+
+
+def calendar_rows(appointments):
+    return appointments.order_by("appointment_date").values_list("appointment_date", "notes", "patient__name")
+
+
+def _calendar_etag(request):
+    try:
+        _, summary = _calendar_appointments(request)
+    except ValueError:
+        return None
+    return calendar_etag_for(request.user.id, summary)
+
+
+# ETag only: Last-Modified (the newest updated_at) would not move when an
+# appointment is deleted, so If-Modified-Since could revalidate a stale feed
+@condition(etag_func=_calendar_etag)
 def appointments_json(request):
-    doctor = Doctor.objects.get(user=request.user)
+    try:
+        appointments, _ = _calendar_appointments(request)
+    except ValueError:
+        return JsonResponse({"error": "Invalid start or end"}, status=400)
+
+    return JsonResponse(calendar_events(calendar_rows(appointments)), safe=False)
+
 
-    appointments = Appointment.objects.filter(doctor=doctor)
+#  Access Log API (keyset-paginated, newest first)
+ACCESS_LOG_PAGE_SIZE = 50
+ACCESS_LOG_MAX_PAGE_SIZE = 200
+
+@replica_reads
+@user_passes_test(is_admin)
+def access_logs_json(request):
+    logs = AccessLog.objects.all()
 
-    data = []
-    for a in appointments:
-        data.append({
-            "title": f"{a.patient.name}",
-            "start": a.appointment_date.isoformat(),
-            "description": a.notes or ""
+    # Optional filters
+    try:
+        if request.GET.get("doctor"):
+            logs = logs.filter(doctor_id=int(request.GET["doctor"]))
+        if request.GET.get("patient"):
+            logs = logs.filter(patient_id=int(request.GET["patient"]))
+
+        since = parse_datetime(request.GET.get("since", ""))
+        until = parse_datetime(request.GET.get("until", ""))
+        limit = int(request.GET.get("limit", ACCESS_LOG_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid filter"}, status=400)
+
+    if request.GET.get("action"):
+        logs = logs.filter(action__icontains=request.GET["action"])
+    if since:
+        logs = logs.filter(timestamp__gte=since)
+    if until:
+        logs = logs.filter(timestamp__lt=until)
+
+    limit = max(1, min(limit, ACCESS_LOG_MAX_PAGE_SIZE))
+
+    logs = logs.values(
+        "id", "timestamp", "action",
+        "user__username", "doctor__name", "patient__name",
+    )
+
+    try:
+        rows, next_cursor = keyset_page(logs, request.GET.get("cursor"), limit)
+    except InvalidCursor:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    results = []
+    for row in rows:
+        if row["user__username"]:
+            actor = f"{row['user__username']} (Admin/User)"
+        elif row["doctor__name"]:
+            actor = f"Dr. {row['doctor__name']}"
+        else:
+            actor = "Unknown"
+
+        results.append({
+            "id": row["id"],
+            "actor": actor,
+            "patient": row["patient__name"] or "",
+            "action": row["action"],
+            "timestamp": row["timestamp"].isoformat(),
         })
 
-    return JsonResponse(data, safe=False)
+    return JsonResponse({"results": results, "next": next_cursor})
+
+
+#  Free appointment slots for a doctor or a specialization
+@login_required
+def available_slots(request):
+    doctors = Doctor.objects.all()
+    if request.GET.get("doctor"):
+        doctors = doctors.filter(id=request.GET["doctor"])
+    elif request.GET.get("specialization"):
+        doctors = doctors.filter(specialization=request.GET["specialization"])
+    else:
+        return JsonResponse({"error": "Pass doctor or specialization"}, status=400)
+
+    try:
+        start = _parse_calendar_bound(request.GET.get("start")) or timezone.now()
+        end = _parse_calendar_bound(request.GET.get("end")) or start + datetime.timedelta(days=7)
+        duration = int(request.GET.get("duration", scheduling.DEFAULT_DURATION))
+        doctors = list(doctors.values_list("id", flat=True))
+    except ValueError:
+        return JsonResponse({"error": "Invalid filter"}, status=400)
+    if duration < 1:
+        return JsonResponse({"error": "Invalid duration"}, status=400)
+    end = min(end, start + datetime.timedelta(days=CALENDAR_MAX_WINDOW_DAYS))
+
+    slots = scheduling.free_slots(Doctor.objects.filter(id__in=doctors), start, end, duration)
+    return JsonResponse([
+        {"doctor": doctor_id, "start": slot_start.isoformat(), "end": slot_end.isoformat()}
+        for doctor_id, slot_start, slot_end in slots
+    ], safe=False)
+
+
+#  Admin NDJSON export, streamed (optionally gzipped)
+@user_passes_test(is_admin)
+def export_data(request, entity):
+    if entity not in export.ENTITIES:
+        return JsonResponse({"error": "Unknown entity"}, status=404)
+
+    try:
+        patient = int(request.GET["patient"]) if request.GET.get("patient") else None
+        doctor = int(request.GET["doctor"]) if request.GET.get("doctor") else None
+        since = _parse_calendar_bound(request.GET.get("since"))
+        until = _parse_calendar_bound(request.GET.get("until"))
+    except ValueError:
+        return JsonResponse({"error": "Invalid filter"}, status=400)
+
+    histories = request.GET.get("histories") == "1"
+    compress = request.GET.get("gzip") == "1"
+
+    action = f"Exported {entity}"
+    if histories:
+        action += " with medical histories"
+    audit.record(user=request.user, action=action)
+
+    stream = export.export_stream(
+        entity,
+        compress=compress,
+        histories=histories,
+        patient=patient,
+        doctor=doctor,
+        since=since,
+        until=until,
+    )
+    filename = f"{entity}.ndjson" + (".gz" if compress else "")
+    response = StreamingHttpResponse(
+        stream,
+        content_type="application/gzip" if compress else "application/x-ndjson",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+#  Prometheus-style metrics for scraping
+@user_passes_test(is_admin)
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+#  Patient / doctor search and autocomplete
+@login_required
+def search_json(request):
+    query = request.GET.get("q", "")
+    kind = request.GET.get("type", "patients")
+    prefix = request.GET.get("mode") == "prefix"
+    try:
+        limit = int(request.GET.get("limit", search.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    if kind == "doctors":
+        return JsonResponse({"results": search.search_doctors(query, prefix, limit)})
+    if kind != "patients":
+        return JsonResponse({"error": "Unknown type"}, status=400)
+
+    # Doctors only search patients who granted them consent
+    if request.role == roles.ADMIN:
+        doctor_id = None
+    elif request.role == roles.DOCTOR:
+        doctor_id = request.doctor_id
+    else:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    if request.GET.get("contact"):
+        # Exact identity lookup through the blind index
+        patients = Patient.objects.by_contact(request.GET["contact"])
+        if doctor_id is not None:
+            patients = patients.filter(consent__doctor_id=doctor_id, consent__granted=True)
+        results = list(patients.order_by("name", "id").values("id", "name", "contact")[:search.MAX_LIMIT])
+    else:
+        results = search.search_patients(query, doctor_id=doctor_id, prefix=prefix, limit=limit)
+    return JsonResponse({"results": results})